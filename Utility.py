@@ -8,16 +8,18 @@
 |                                                                    |
 | history:                                                           |
 | 191120 - F.Messi - Plot1D() from AMBA project                      |
+| 261018 - Plot1D() without plt.hist, Draw1D(), pyplot loaded lazily |
 |                                                                    |
  --------------------------------------------------------------------
 '''
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-def Plot1D(dataArray, nBin=0, R=(0,0), title='title here...', xlabel='here label...', label='data', c=1, log=False, weights=None):
+def Plot1D(dataArray, nBin=0, R=(0,0), title='title here...', xlabel='here label...', label='data', c=1, log=False, weights=None, scale=None):
     '''
     SCOPE: a 1D histo function...
+    NOTE: the histogram is computed with np.histogram and drawn by Draw1D();
+          use scale (a number) instead of a list of equal weights to normalize it
     INPUT:
     OUTPUT:
     '''
@@ -25,13 +27,23 @@ def Plot1D(dataArray, nBin=0, R=(0,0), title='title here...', xlabel='here label
         nBin = (int(max(dataArray)))
     if R==(0,0):
         R = (dataArray.min()-0.5, dataArray.max()+0.5)
+    n, bins = np.histogram(dataArray, bins=nBin, range=R, weights=weights)
+    if scale is not None: n = n * scale
+    return Draw1D(n, bins, title=title, xlabel=xlabel, label=label, c=c, log=log)
+
+def Draw1D(n, bins, title='title here...', xlabel='here label...', label='data', c=1, log=False):
+    '''
+    SCOPE: draw an already computed 1D histo (as Plot1D)
+    INPUT: counts, bin edges
+    OUTPUT: counts, bin edges, the drawn StepPatch
+    '''
+    import matplotlib.pyplot as plt
     FigSize = [11.69,8.27] #A4 = 8.27x11.69inch
     fig = plt.figure(c,FigSize)
     plt.title(title)
     plt.xlabel(xlabel)
-    #dataArray.hist(bins=nBin, histtype='step', fill=False)
-    n, bins, patches = plt.hist(dataArray, bins=nBin, range=R,  histtype='step', fill=False, log=log, label=label, weights=weights)
-    #return dataArray.hist(bins=nBin, histtype='step', fill=False ) #,edgecolor='black')
+    patches = plt.stairs(n, bins, fill=False, label=label)
+    if log: plt.yscale('log')
     return n, bins, patches
 
 def IrradiationRate(A = 2500, D = 1500, R = 2.99E6):
@@ -54,6 +66,7 @@ def CalculateIrradiation(A = 2500, D = 1500, Rmin=100, Rmax=2500,
     for a in range(Rmin,Rmax):
         Ir.append(IrradiationRate(A=A, D=a, R=R))
         d.append(a)
+    import matplotlib.pyplot as plt
     plt.plot(d,Ir, label=label)
     plt.xlabel('distance (mm)')
     plt.ylabel('irradiation (n/sec)')
@@ -5,7 +5,7 @@ from serial.tools.list_ports import comports
 from influxdb import InfluxDBClient
 from shutil import copyfile
 import os.path as p
-import config
+from batchwriter import BatchWriter, parse_line
 # Scan Serial ports and found ArduSiPM
 ports = list(comports())
 ser = Serial()
@@ -23,22 +23,27 @@ ser.baudrate = 115200
 ser.timeout = None  # try to solve delay
 if not p.isfile("config.py"):
     copyfile("config.sample.py", "config.py")
+import config
 client = InfluxDBClient(config.influxdbhost,
                         config.influxdbport,
                         config.influxdbuser,
                         config.influxdbpasswd,
                         config.influxdbdb)
+writer = BatchWriter(client,
+                     batch_size=getattr(config, 'batch_size', 500),
+                     flush_interval=getattr(config, 'flush_interval', 5.),
+                     spill_file=getattr(config, 'spill_file', 'spill.jsonl'))
+writer.start()
 ser.open()
-while True:
-    data = ser.readline().rstrip().decode('ascii')
-    dolpos = data.find('$')
-    counts = int(data[dolpos + 1:])
-    point = {
-        "time": dt.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
-        "measurement": "Counts",
-        "fields": {
-            "value": counts,
-        }
-    }
-    #print(point)
-    client.write_points([point], time_precision='s')
+try:
+    while True:
+        data = ser.readline().rstrip().decode('ascii')
+        try:
+            points = parse_line(data, dt.utcnow())
+        except ValueError:
+            continue  # not a data line
+        #print(points)
+        writer.write(points)
+finally:
+    writer.close()
+    print("points written:", writer.written, "spilled:", writer.spilled, "unreadable:", writer.unreadable)
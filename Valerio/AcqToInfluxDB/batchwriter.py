@@ -0,0 +1,152 @@
+from json import dumps, loads
+from os import path, remove, replace
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+
+def parse_line(data, when):
+    """Points of an ArduSiPM line: counts (CPS, number of hits) and one point per TDC/ADC hit."""
+    dolpos = data.find('$')
+    counts = int(data[dolpos + 1:])
+    stamp = when.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    hits = []
+    if data.startswith('t'):
+        for n, hit in enumerate(data[1:dolpos].split('t')):
+            tdc, _, adc = hit.partition('v')
+            try:
+                hits.append({"time": stamp, "measurement": "Hits", "tags": {"hit": n},
+                             "fields": {"tdc": int(tdc, 16), "adc": int(adc, 16)}})
+            except ValueError:
+                pass  # corrupted hit, CPS is still valid
+    elif data.startswith('v'):
+        for n, adc in enumerate(data[1:dolpos].split('v')):
+            try:
+                hits.append({"time": stamp, "measurement": "Hits", "tags": {"hit": n},
+                             "fields": {"adc": int(adc, 16)}})
+            except ValueError:
+                pass
+    point = {"time": stamp, "measurement": "Counts",
+             "fields": {"value": counts, "hits": len(hits)}}
+    return [point] + hits
+
+
+class BatchWriter(Thread):
+    """Write points to InfluxDB from a background thread, in batches.
+
+    A batch is sent when it has batch_size points or flush_interval seconds
+    after its first point. A failed write is retried (retries times, waiting
+    retry_wait, doubled at each attempt), then the batch is appended to
+    spill_file (one JSON point per line) and sent again after the next
+    successful write. If the queue is full the points go straight to spill_file,
+    so the serial reading is never blocked by a slow database. The spill file is
+    shared by the caller and the writer thread, every access holds spill_lock;
+    lines that cannot be parsed when resending are skipped and counted in unreadable.
+    """
+
+    def __init__(self, client, batch_size=500, flush_interval=5., queue_size=100000,
+                 retries=3, retry_wait=1., spill_file='spill.jsonl', time_precision='u'):
+        super().__init__(daemon=True)
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = Queue(maxsize=queue_size)
+        self.retries = retries
+        self.retry_wait = retry_wait
+        self.spill_file = spill_file
+        self.time_precision = time_precision
+        self.spill_lock = Lock()
+        self.written = 0
+        self.spilled = 0
+        self.unreadable = 0
+
+    def write(self, points):
+        for point in points:
+            try:
+                self.queue.put_nowait(point)
+            except Full:
+                self._spill([point])
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - monotonic(), 0)
+            try:
+                point = self.queue.get(timeout=timeout)
+            except Empty:
+                point = ''
+            if point is None:
+                break
+            if point:
+                if not batch:
+                    deadline = monotonic() + self.flush_interval
+                batch.append(point)
+            if batch and (len(batch) >= self.batch_size or monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+        if batch:
+            self._flush(batch)
+
+    def _send(self, batch):
+        wait = self.retry_wait
+        for attempt in range(self.retries + 1):
+            try:
+                self.client.write_points(batch, time_precision=self.time_precision)
+                return True
+            except Exception as error:
+                print("InfluxDB write failed ({}): {}".format(attempt + 1, error))
+                if attempt < self.retries:
+                    sleep(wait)
+                    wait *= 2
+        return False
+
+    def _flush(self, batch):
+        if not self._send(batch):
+            self._spill(batch)
+            return
+        self.written += len(batch)
+        if self.spill_file and path.isfile(self.spill_file):
+            self._resend()
+
+    def _spill(self, batch):
+        if not self.spill_file:
+            return
+        lines = ''.join(dumps(point) + '\n' for point in batch)
+        with self.spill_lock:
+            with open(self.spill_file, 'a') as spill:
+                spill.write(lines)
+            self.spilled += len(batch)
+
+    def _resend(self):
+        # the spill file is moved away first, what fails again is spilled anew
+        sending = self.spill_file + '.sending'
+        with self.spill_lock:
+            if not path.isfile(self.spill_file):
+                return
+            replace(self.spill_file, sending)
+        with open(sending) as spill:
+            batch = []
+            for line in spill:
+                try:
+                    batch.append(loads(line))
+                except ValueError:
+                    self.unreadable += 1
+                    continue
+                if len(batch) >= self.batch_size:
+                    self._flush_spilled(batch)
+                    batch = []
+            if batch:
+                self._flush_spilled(batch)
+        remove(sending)
+
+    def _flush_spilled(self, batch):
+        if self._send(batch):
+            self.written += len(batch)
+        else:
+            self._spill(batch)
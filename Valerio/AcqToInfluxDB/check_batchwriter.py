@@ -0,0 +1,109 @@
+"""Check BatchWriter against a stand-in InfluxDB client, without a server.
+
+Run from this folder: python check_batchwriter.py
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from json import dumps
+from os import path
+from tempfile import mkdtemp
+from shutil import rmtree
+from threading import Lock
+from time import monotonic, sleep
+from batchwriter import BatchWriter, parse_line
+
+# lines as read from ArduSiPM ('@', '#' and '$' modes, a corrupted hit, a menu line)
+LINES = ['t1a3v2ft5c0v1bt9e4v45$3', 't2b7v10$1', 'v2fv1b$2', '$0', 't8f2v3at0g1v2$2',
+         'tfffv0t1v1t2v2t3v3$4', 'ArduSiPM menu']
+
+
+class StubClient:
+    """write_points of InfluxDBClient: fails while down, keeps what it accepts."""
+
+    def __init__(self):
+        self.down = False
+        self.lock = Lock()
+        self.batches = []  # (monotonic time, number of points)
+        self.points = Counter()
+
+    def write_points(self, batch, time_precision=None):
+        if self.down:
+            raise ConnectionError('stub server down')
+        with self.lock:
+            self.batches.append((monotonic(), len(batch)))
+            self.points.update(dumps(point, sort_keys=True) for point in batch)
+
+
+def make_points(n, start=datetime(2026, 10, 18)):
+    """Points of n lines, each line with its own time (so that every point is unique)."""
+    points = []
+    for i in range(n):
+        try:
+            points += parse_line(LINES[i % len(LINES)], start + timedelta(microseconds=i))
+        except ValueError:
+            pass  # not a data line, skipped as in AcqToInfluxDB.py
+    return points
+
+
+def sent(points):
+    return Counter(dumps(point, sort_keys=True) for point in points)
+
+
+def check_size_flush(folder):
+    client = StubClient()
+    writer = BatchWriter(client, batch_size=50, flush_interval=60., spill_file=path.join(folder, 'size.jsonl'))
+    writer.start()
+    points = make_points(200)
+    writer.write(points)
+    sleep(0.5)
+    full = [n for t, n in client.batches]
+    writer.close()
+    assert full and all(n == 50 for n in full), full
+    assert client.points == sent(points), 'points lost or duplicated'
+
+
+def check_time_flush(folder):
+    client = StubClient()
+    writer = BatchWriter(client, batch_size=10**6, flush_interval=0.2, spill_file=path.join(folder, 'time.jsonl'))
+    writer.start()
+    points = make_points(10)
+    start = monotonic()
+    writer.write(points)
+    sleep(0.6)
+    assert len(client.batches) == 1, client.batches
+    assert 0.15 <= client.batches[0][0] - start <= 0.5, client.batches[0][0] - start
+    writer.close()
+    assert client.points == sent(points), 'points lost or duplicated'
+
+
+def check_spill_and_recover(folder):
+    client = StubClient()
+    spill = path.join(folder, 'spill.jsonl')
+    writer = BatchWriter(client, batch_size=20, flush_interval=0.05, queue_size=50, retries=1, retry_wait=0.01,
+                         spill_file=spill)
+    writer.start()
+    client.down = True
+    points = make_points(300)
+    for i in range(0, len(points), 25):  # the small queue spills also from write()
+        writer.write(points[i:i + 25])
+    sleep(0.5)
+    assert path.isfile(spill) and writer.spilled, 'nothing spilled while the server was down'
+    client.down = False
+    more = make_points(20, start=datetime(2026, 10, 19))
+    writer.write(more)
+    sleep(0.5)
+    writer.close()
+    assert not path.isfile(spill) and not path.isfile(spill + '.sending'), 'spill file not resent'
+    assert client.points == sent(points + more), 'points lost or duplicated'
+    assert max(client.points.values()) == 1
+    assert writer.unreadable == 0
+
+
+if __name__ == '__main__':
+    folder = mkdtemp(prefix='batchwriter_')
+    try:
+        for check in (check_size_flush, check_time_flush, check_spill_and_recover):
+            check(folder)
+            print(check.__name__, 'ok')
+    finally:
+        rmtree(folder, ignore_errors=True)
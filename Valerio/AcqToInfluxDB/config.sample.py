@@ -3,3 +3,6 @@ influxdbport = 8086
 influxdbuser = 'root'
 influxdbpasswd = 'root'
 influxdbdb = 'ArduSiPM'
+batch_size = 500
+flush_interval = 5.
+spill_file = 'spill.jsonl'
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  serial acquisition           |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, lossless reader of the serial stream        |
+|          reader/writer threads streaming the data to disk          |
+|          acknowledged commands, persistent session                 |
+|          live monitor fed by the writer thread                     |
+|          Open_Port() also for virtual devices                      |
+|          time index of the datafiles written by the writer         |
+ --------------------------------------------------------------------
+'''
+
+import os
+import time
+import threading
+from queue import Queue, Empty, Full
+from datetime import datetime, timedelta
+
+SYNC_LINES = 1  ## lines dropped by ArduSiPM_LineReader to start on a line boundary (see Acquire_Lossless)
+
+## answers of the ArduSiPM menu that acknowledge each step (see Menu_Command, Set_Threshold)
+MENU_TEXT = 'menu'            ## in the menu page sent after m
+THRESHOLD_TEXT = 'threshold'  ## in the prompt sent after t
+
+'''==================
+     Serial stream
+=================='''
+def Find_ASPM_Ports(debug=False):
+    '''
+    SCOPE: search all the ArduSiPM connected (as aaa.Search_ASPM, that returns only the first one)
+    INPUT: none
+    OUTPUT: list of serial port names
+    '''
+    import serial.tools.list_ports
+    found = []
+    for port in serial.tools.list_ports.comports():
+        if(debug): print(port)
+        if str(port).find('Arduino')>0: found.append(str(port).split(" ")[0])
+    return(found)
+
+def Open_Port(port=None, baudrate=115200, timeout=None, debug=False):
+    '''
+    SCOPE: open the connection to an ArduSiPM: a serial port, or a virtual device
+    NOTE: port names virtual://... and replay://<datafile> give an a_virtual.ArduSiPM_Virtual
+          (synthetic or replayed data, see a_virtual.Open_Virtual), without hardware
+    INPUT: port name (default: first ArduSiPM found), baudrate, timeout
+    OUTPUT: the open port (None if no ArduSiPM is found)
+    '''
+    if port is None:
+        ports = Find_ASPM_Ports(debug=debug)
+        if not ports: return(None)
+        port = ports[0]
+    if port.startswith(('virtual://', 'replay://')):
+        import a_virtual
+        ser = a_virtual.Open_Virtual(port, baudrate=baudrate)
+        ser.timeout = timeout
+        return(ser)
+    import serial
+    ser = serial.Serial()
+    ser.baudrate = baudrate
+    ser.timeout = timeout
+    ser.port = port
+    ser.open()
+    time.sleep(1) ## the Arduino resets when the port is opened
+    return(ser)
+
+class Shared_Clock:
+    '''
+    SCOPE: clock for the arrival times, to be shared by many readers
+    NOTE: times are the wall time at creation plus the monotonic time elapsed since,
+          so they never jump (NTP, daylight saving) and are consistent between devices
+    '''
+    def __init__(self):
+        self.wall = datetime.now()
+        self.mono = time.monotonic_ns()
+
+    def __call__(self):
+        return(self.wall + timedelta(microseconds=(time.monotonic_ns()-self.mono)//1000))
+
+class ArduSiPM_LineReader:
+    '''
+    SCOPE: lossless reader of the ArduSiPM serial stream
+    NOTE: all the bytes waiting in the port are read at once and split in lines here,
+          each line is timestamped when it arrives; the first line after the reader
+          is created is usually cut, it is always discarded (SYNC_LINES) and counted as
+          dropped: a line cut at a hit boundary looks complete, it cannot be told apart
+    INPUT: an open serial port, the polling time in seconds, the clock for the
+           arrival times (a function returning a datetime, see Shared_Clock)
+    '''
+    def __init__(self, ser, poll=0.05, clock=datetime.now):
+        self.ser = ser
+        self.clock = clock
+        self.buffer = bytearray()
+        self.synced = 0    ## lines dropped so far to start on a line boundary
+        self.nLines = 0    ## complete lines returned
+        self.nPartial = 0  ## lines returned that are not a complete record (no '$' or bad bytes)
+        self.nDropped = 0  ## lines discarded
+        self.nBytes = 0
+        self._timeout = ser.timeout
+        ser.timeout = poll
+
+    def Read(self):
+        '''
+        SCOPE: read what is available on the port (waits at most the polling time)
+        INPUT: none
+        OUTPUT: list of (arrival time as datetime, line as str)
+        '''
+        chunk = self.ser.read(self.ser.in_waiting or 1)
+        if not chunk: return([])
+        arrival = self.clock()
+        self.nBytes += len(chunk)
+        self.buffer += chunk
+        lines = self.buffer.split(b'\n')
+        self.buffer = lines.pop() ## the last line is not complete yet
+        lista = []
+        for line in lines:
+            if self.synced < SYNC_LINES:
+                self.synced += 1
+                self.nDropped += 1
+                continue
+            line = line.strip()
+            if not line: continue
+            try: line = line.decode('ascii')
+            except UnicodeDecodeError:
+                line = line.decode('ascii', errors='replace')
+                self.nPartial += 1
+            else:
+                if '$' not in line: self.nPartial += 1
+            self.nLines += 1
+            lista.append((arrival, line))
+        return(lista)
+
+    def Close(self):
+        '''
+        SCOPE: give back the port with its original timeout, the incomplete line left is dropped
+        '''
+        if self.buffer.strip(): self.nDropped += 1
+        self.buffer = bytearray()
+        self.ser.timeout = self._timeout
+
+    def Report(self):
+        print(f'read {self.nBytes} bytes: {self.nLines} lines, {self.nPartial} partial, {self.nDropped} dropped')
+
+def Format_Record(arrival, line):
+    '''
+    SCOPE: record as saved on file by aaa.Save_Data(): u<%y%m%d%H%M%S.%f><line from ArduSiPM>
+    INPUT: arrival time (datetime), line (str)
+    OUTPUT: the record (str)
+    '''
+    return(f"u{arrival.strftime('%y%m%d%H%M%S.%f')}{line}")
+
+def Acquire_Sampled(duration_acq, ser, debug=False):
+    '''
+    SCOPE: acquire one line every 0.2 sec for a given time (original acquisition of aaa.Acquire_ASPM)
+    NOTE: the lines sent by ArduSiPM in between are discarded
+    INPUT: duration in seconds, an open serial port
+    OUTPUT: list of records (see Format_Record())
+    '''
+    lista = []
+    start_acq_time = datetime.now()
+    stop_acq_time = start_acq_time + timedelta(seconds=duration_acq-1)
+    acq_time = datetime.now()
+    while(acq_time < stop_acq_time):
+        acq_time = datetime.now()
+        ser.reset_input_buffer() # Flush all the previous data in Serial port
+        data = ser.readline().rstrip()
+        tdata = Format_Record(acq_time, data.decode('ascii'))
+        if(debug): print(tdata)
+        lista.append(tdata)
+        time.sleep(0.2)
+    return(lista)
+
+def Acquire_Lossless(duration_acq, ser, debug=False):
+    '''
+    SCOPE: acquire all the lines sent by ArduSiPM for a given time
+    NOTE: all the lines after the first one: the input is flushed when the acquisition starts,
+          the first line received may be cut and is dropped by design (SYNC_LINES)
+    INPUT: duration in seconds, an open serial port
+    OUTPUT: list of records (see Format_Record()), the ArduSiPM_LineReader with the statistics
+    '''
+    lista = []
+    reader = ArduSiPM_LineReader(ser)
+    ser.reset_input_buffer() # start from fresh data, once
+    stop_acq_time = datetime.now() + timedelta(seconds=duration_acq-1)
+    try:
+        while(datetime.now() < stop_acq_time):
+            for arrival, line in reader.Read():
+                tdata = Format_Record(arrival, line)
+                if(debug): print(tdata)
+                lista.append(tdata)
+    finally:
+        reader.Close()
+    reader.Report()
+    return(lista, reader)
+
+'''==================
+     Commands
+=================='''
+def Wait_Response(ser, expect=None, timeout=2., quiet=0.2):
+    '''
+    SCOPE: wait for the answer of ArduSiPM to a command
+    NOTE: with expect, waits for a text containing it; without, waits for the device
+          to answer something and then be silent for `quiet` seconds (end of a menu page)
+    INPUT: an open serial port, expected text, timeout and quiet time in seconds
+    OUTPUT: the text received (str), None if the expected answer did not arrive
+    '''
+    old_timeout = ser.timeout
+    ser.timeout = min(quiet, 0.05)
+    received = bytearray()
+    start = time.monotonic()
+    last = None
+    try:
+        while time.monotonic() - start < timeout:
+            chunk = ser.read(ser.in_waiting or 1)
+            now = time.monotonic()
+            if chunk:
+                received += chunk
+                last = now
+                if expect and expect.encode('utf-8') in received: break
+            elif last is not None and not expect and now - last >= quiet: break
+        else:
+            ## timeout: without expect a device that keeps sending is alive anyway
+            if expect or not received: return(None)
+    finally:
+        ser.timeout = old_timeout
+    return(received.decode('ascii', errors='replace'))
+
+def Send_Command(ser, command, expect=None, timeout=2., quiet=0.2, retries=2, flush=True, debug=False):
+    '''
+    SCOPE: send a command to ArduSiPM and wait for its answer (instead of a fixed sleep)
+    NOTE: the command is sent again (at most retries times) only if the device did not
+          answer at all, or if the expected text did not arrive
+    INPUT: an open serial port, the command (str or bytes), expect/timeout/quiet as in
+           Wait_Response(), number of retries, flush the old input before sending
+    OUTPUT: the answer (str), None if there was no valid answer
+    '''
+    if isinstance(command, str): command = command.encode('utf-8')
+    for attempt in range(retries+1):
+        if flush: ser.reset_input_buffer()
+        ser.write(command)
+        answer = Wait_Response(ser, expect=expect, timeout=timeout, quiet=quiet)
+        if(debug): print(f'sent {command}, answer {answer!r}')
+        if answer is not None: return(answer)
+    print(f'    no answer from ArduSiPM to command {command}')
+    return(None)
+
+def _Menu_Steps(ser, steps, debug=False):
+    '''
+    SCOPE: enter the menu (m), send the steps and exit (e), each one acknowledged by its answer
+    NOTE: a step is acknowledged only by its expected text (never by a timeout, or by data
+          still streaming); after the first step not acknowledged the others are not sent,
+          e is sent anyway to leave the menu
+    INPUT: an open serial port, list of (command, expected text)
+    OUTPUT: True if all the steps were acknowledged
+    '''
+    ok = True
+    for command, expect in [('m', MENU_TEXT)] + list(steps):
+        ok = Send_Command(ser, command, expect=expect, debug=debug) is not None
+        if not ok: break
+    ok &= Send_Command(ser, 'e', expect='$', timeout=3., debug=debug) is not None
+    return(ok)
+
+def Menu_Command(ser, command, expect=None, debug=False):
+    '''
+    SCOPE: enter the menu (m), send a command and exit (e), waiting each answer
+    INPUT: an open serial port, the command, its expected answer (default: the command itself, echoed)
+    OUTPUT: True if all the steps were acknowledged
+    '''
+    return(_Menu_Steps(ser, [(command, expect or str(command).strip())], debug=debug))
+
+def Set_Threshold(ser, threshold, debug=False):
+    '''
+    SCOPE: set the threshold through the menu (m, t, <value>, e), waiting each answer
+    NOTE: t is acknowledged by the threshold prompt, the value by its echo
+    INPUT: an open serial port, the threshold
+    OUTPUT: True if all the steps were acknowledged
+    '''
+    return(_Menu_Steps(ser, [('t', THRESHOLD_TEXT), (str(threshold), str(threshold))], debug=debug))
+
+def Set_Mode(ser, mode, debug=False):
+    '''
+    SCOPE: select the data sent by ArduSiPM: '$' counts only, '#' ADC+CPS, '@' TDC+ADC+CPS
+    NOTE: acknowledged by the first record received after the command
+    INPUT: an open serial port, the mode
+    OUTPUT: True if acknowledged
+    '''
+    return(Send_Command(ser, mode, expect='$', timeout=3., debug=debug) is not None)
+
+def Query_Info(ser, debug=False):
+    '''
+    SCOPE: retrive basic information from ArduSiPM (as the original ArduSiPM_info by V.Bocci)
+    INPUT: an open serial port
+    OUTPUT: dict with FW (firmware version), SN (serial number), HV (HV code), ID
+    '''
+    info = {}
+    for command, key, name in (('F', '@FW', 'FW'), ('S', '@SN', 'SN'), ('H', '@HV', 'HV'), ('I', '@I', 'ID')):
+        answer = Send_Command(ser, f'{command}\n\r', expect=key, timeout=3., debug=debug)
+        if answer is None: continue
+        answer = answer[answer.find(key):]
+        if '\n' not in answer: answer += Wait_Response(ser, expect='\n', timeout=1.) or ''
+        info[name] = answer.splitlines()[0][3:].strip()
+    return(info)
+
+'''==================
+     Streaming to disk
+=================='''
+def Run_File_Name(start_time, file_par='RawData'):
+    '''
+    SCOPE: name of a datafile, as used by RunIt: <%y%m%d%H%M%S>_<file_par>.csv
+    INPUT: start time of the file (datetime), label
+    OUTPUT: the file name (str)
+    '''
+    return(f"{start_time.strftime('%y%m%d%H%M%S')}_{file_par}.csv")
+
+class ArduSiPM_Reader(threading.Thread):
+    '''
+    SCOPE: producer thread, reads the serial port and puts the records in a queue
+    NOTE: if the queue is full for more than put_timeout seconds the record is lost
+          and counted in nLost (the writer is too slow); if the consumer thread dies
+          (e.g. disk full) the reader stops too; an error of the port (e.g. device
+          unplugged) stops the reader and is kept in error
+    INPUT: an open serial port, the queue, the consumer thread (e.g. an ArduSiPM_Writer)
+    '''
+    def __init__(self, ser, queue, debug=False, put_timeout=1., clock=datetime.now, consumer=None):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.consumer = consumer
+        self.clock = clock
+        self.queue = queue
+        self.debug = debug
+        self.put_timeout = put_timeout
+        self.stopped = threading.Event()
+        self.reader = None
+        self.nLost = 0
+        self.error = None
+
+    def _Consuming(self):
+        return(self.consumer is None or self.consumer.is_alive())
+
+    def run(self):
+        self.reader = ArduSiPM_LineReader(self.ser, clock=self.clock)
+        try:
+            while not self.stopped.is_set() and self._Consuming():
+                for arrival, line in self.reader.Read():
+                    tdata = Format_Record(arrival, line)
+                    if(self.debug): print(tdata)
+                    try: self.queue.put(tdata, timeout=self.put_timeout)
+                    except Full: self.nLost += 1
+        except Exception as error:
+            self.error = error
+        finally:
+            self.reader.Close()
+            while self._Consuming(): ## tells the writer that the stream is over
+                try:
+                    self.queue.put(None, timeout=self.put_timeout)
+                    break
+                except Full:
+                    continue
+        if self.error: print(f'    ERROR reading {getattr(self.ser, "port", self.ser)}: {self.error}')
+
+    def Stop(self):
+        self.stopped.set()
+
+class ArduSiPM_Writer(threading.Thread):
+    '''
+    SCOPE: consumer thread, appends the records from a queue to the datafile, one per line
+    NOTE: the file is flushed and fsync'ed every flush_every seconds, a new file is
+          started when the current one is larger than max_bytes or older than max_seconds
+          (None = no rotation); file names come from Run_File_Name(); with time_index the
+          byte offset of the first record of each minute is kept and saved, when the file
+          is closed, as the time index of the file (see lf.Load_Time_Index)
+    INPUT: the queue, label of the files, folder, flush and rotation settings,
+           header = comment line (starting with '#') written at the top of each file,
+           monitor = an a_monitor.ArduSiPM_Monitor that gets a copy of each record,
+           time_index; an error writing the files stops the thread and is kept in error
+    '''
+    def __init__(self, queue, file_par='RawData', directory='.', flush_every=5., max_bytes=None, max_seconds=None,
+                 header=None, monitor=None, time_index=True):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.header = header
+        self.monitor = monitor
+        self.time_index = time_index
+        self.file_par = file_par
+        self.directory = directory
+        self.flush_every = flush_every
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.files = []
+        self.nRecords = 0
+        self.file = None
+        self.error = None
+
+    def _Open(self):
+        if self.file: self._Close()
+        start = datetime.now()
+        file_name = os.path.join(self.directory, Run_File_Name(start, self.file_par))
+        n = 0
+        while os.path.exists(file_name) or file_name in self.files: ## two files in the same second
+            n = n+1
+            file_name = os.path.join(self.directory, Run_File_Name(start, f'{self.file_par}-{n}'))
+        self.file = open(file_name, 'a', encoding='ascii', errors='replace') ## bad bytes of the port are U+FFFD
+        self.files.append(file_name)
+        self.opened = time.monotonic()
+        self.nBytes = 0
+        self.blocks = []
+        self.minute = None
+        if self.header:
+            self.file.write(self.header + '\n')
+
+    def _Flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.flushed = time.monotonic()
+
+    def _Close(self):
+        self._Flush()
+        self.file.close()
+        self.file = None
+        if self.time_index and self.blocks: self._Save_Index()
+
+    def _Save_Index(self):
+        import numpy as np
+        import a_load as lf
+        times, offsets = zip(*self.blocks)
+        times = lf._Parse_Time(np.array(times, dtype='S')).view(np.int64)
+        valid = times != np.iinfo(np.int64).min
+        try: lf.Save_Time_Index(self.files[-1], times[valid], np.array(offsets)[valid], block=60)
+        except OSError as error: print(f'    time index not written for file {self.files[-1]}: {error}')
+
+    def run(self):
+        try:
+            self._Open()
+            self.flushed = time.monotonic()
+            while True:
+                try: tdata = self.queue.get(timeout=self.flush_every)
+                except Empty: tdata = ''
+                if tdata is None: break
+                now = time.monotonic()
+                if tdata:
+                    if ((self.max_bytes and self.nBytes >= self.max_bytes)
+                        or (self.max_seconds and now - self.opened >= self.max_seconds)):
+                        self._Open()
+                    if self.time_index and tdata[1:11] != self.minute: ## u<%y%m%d%H%M>...
+                        self.minute = tdata[1:11]
+                        ## time as in Format_Record(), bytes on disk from tell() (once a minute)
+                        self.blocks.append((tdata[1:20], self.file.tell()))
+                    self.file.write(tdata)
+                    self.file.write('\n')
+                    self.nBytes += len(tdata) + 1
+                    self.nRecords += 1
+                    if self.monitor: self.monitor.Put(tdata)
+                if now - self.flushed >= self.flush_every: self._Flush()
+        except Exception as error:
+            self.error = error
+        finally:
+            try:
+                if self.file: self._Close()
+            except OSError as error:
+                self.error = self.error or error
+        if self.error: print(f'    ERROR writing {self.files[-1] if self.files else self.directory}: {self.error}')
+
+def Acquire_Stream(duration_acq, ser, file_par='RawData', directory='.', debug=False,
+                   queue_size=100000, flush_every=5., max_bytes=None, max_seconds=None, header=None, monitor=None):
+    '''
+    SCOPE: acquire for a given time, streaming the records to disk while acquiring
+    NOTE: a reader thread (ArduSiPM_Reader) and a writer thread (ArduSiPM_Writer)
+          share a bounded queue, the memory used does not grow with the run length;
+          with a monitor (a_monitor.ArduSiPM_Monitor) the main thread refreshes the live plot
+    INPUT: duration in seconds (None = until Ctrl-C), an open serial port, label and folder
+           of the datafiles, size of the queue, flush and rotation settings, header of the files,
+           live monitor
+    OUTPUT: list of the files written (an error of the reader or of the writer is raised after
+            both threads are stopped)
+    '''
+    records = Queue(maxsize=queue_size)
+    writer = ArduSiPM_Writer(records, file_par=file_par, directory=directory, flush_every=flush_every,
+                             max_bytes=max_bytes, max_seconds=max_seconds, header=header, monitor=monitor)
+    reader = ArduSiPM_Reader(ser, records, debug=debug, consumer=writer)
+    writer.start()
+    reader.start()
+    try:
+        if monitor is not None:
+            stopat = None if duration_acq is None else time.monotonic() + max(duration_acq-1, 0)
+            monitor.Run(lambda: not reader.is_alive() or (stopat is not None and time.monotonic() >= stopat))
+        elif duration_acq is None:
+            while reader.is_alive(): reader.join(timeout=1)
+        else: reader.join(timeout=max(duration_acq-1, 0))
+    except KeyboardInterrupt:
+        print('acquisition stopped by user')
+    finally:
+        reader.Stop()
+        reader.join()
+        writer.join()
+    reader.reader.Report()
+    if reader.nLost: print(f'    {reader.nLost} records lost: the writer could not keep up')
+    print(f'{writer.nRecords} records written in {len(writer.files)} files')
+    if monitor is not None:
+        monitor.Update() ## records written after the last refresh
+        monitor.Draw()
+        monitor.Report()
+    if reader.error: raise reader.error
+    if writer.error: raise writer.error
+    return(writer.files)
+
+def Save_Records(records, file_name, header=None):
+    '''
+    SCOPE: save a list of records on file, one per line (as aaa.Save_Data)
+    INPUT: list of records, file name, header = comment line (starting with '#') written first
+    OUTPUT: the file name
+    '''
+    with open(file_name, 'w') as file:
+        if header: file.write(header + '\n')
+        for line in records:
+            file.write(line)
+            file.write('\n')
+    return(file_name)
+
+'''==================
+     Persistent session
+=================='''
+class ArduSiPM_Session:
+    '''
+    SCOPE: connection to an ArduSiPM kept open across many runs (RunLoop, ScanThreshold)
+    NOTE: the port is opened once (opening it resets the Arduino), the settings are sent
+          only when they change; each run starts on fresh data and its file begins with
+          a '#run ...' line with number, start time and settings (skipped by the lf.Load_*)
+    INPUT: port name (default: first ArduSiPM found, see Open_Port), baudrate, mode ('@' TDC+ADC+CPS,
+           '#' ADC+CPS, '$' counts only), debug
+    '''
+    def __init__(self, port=None, baudrate=115200, mode='@', debug=False):
+        self.ser = Open_Port(port, baudrate=baudrate, debug=debug) ## the Arduino resets only once per session
+        if self.ser is None: raise IOError('ArduSiPM not found please connect')
+        port = self.ser.port
+        self.mode = mode
+        self.current_mode = None
+        self.threshold = None
+        self.nRun = 0
+        self.debug = debug
+        print(f'Session opened on port {port}')
+
+    def Configure(self, threshold=None, mode=None):
+        '''
+        SCOPE: send the settings that differ from the current ones
+        INPUT: threshold, mode (None = keep)
+        '''
+        if mode is not None: self.mode = mode
+        if threshold is not None and threshold != self.threshold:
+            ## same sequence of aaa.RunIt
+            Set_Mode(self.ser, '#', debug=self.debug)
+            if not Set_Threshold(self.ser, threshold, debug=self.debug):
+                print(f'    threshold {threshold} not acknowledged by ArduSiPM')
+            Set_Mode(self.ser, '$', debug=self.debug)
+            self.current_mode = '$'
+            self.threshold = threshold
+        if self.mode != self.current_mode:
+            Set_Mode(self.ser, self.mode, debug=self.debug)
+            self.current_mode = self.mode
+
+    def Header(self, start_time):
+        return(f"#run {self.nRun} start={start_time.strftime('%y%m%d%H%M%S.%f')} "
+               f"threshold={self.threshold} mode={self.current_mode} port={self.ser.port}")
+
+    def Run(self, duration_acq, file_par='RawData', threshold=None, mode=None, lossless=True,
+            stream=False, directory='.', **stream_options):
+        '''
+        SCOPE: one run on the open connection
+        INPUT: duration in seconds, label of the file, settings for this run,
+               lossless / stream as in aaa.RunIt, folder, options of Acquire_Stream()
+        OUTPUT: list of the files written
+        '''
+        self.Configure(threshold=threshold, mode=mode)
+        self.nRun += 1
+        start_time = datetime.now()
+        print(f'Run {self.nRun}: acquiring now... this run will stop at {start_time+timedelta(seconds=duration_acq)}')
+        self.ser.reset_input_buffer() ## nothing sent before the start belongs to this run
+        if stream:
+            return(Acquire_Stream(duration_acq, self.ser, file_par=file_par, directory=directory, debug=self.debug,
+                                  header=self.Header(start_time), **stream_options))
+        if lossless: data, reader = Acquire_Lossless(duration_acq, self.ser, debug=self.debug)
+        else: data = Acquire_Sampled(duration_acq, self.ser, debug=self.debug)
+        file_name = os.path.join(directory, Run_File_Name(start_time, file_par))
+        print('SAVING DATA...')
+        return([Save_Records(data, file_name, header=self.Header(start_time))])
+
+    def Close(self):
+        self.ser.close()
+        print(f'Session closed after {self.nRun} runs')
@@ -19,81 +19,104 @@ import time
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
-import matplotlib
-#matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import Utility as ut
 import a_load as lf
-import a_plots as plot
+import a_histo as ah
+## pyplot and a_plots are imported by the plotting functions only:
+## Quality_Stats(), Quality_Loss2D() can run without a display
 
 '''==================
      Data analysis
 =================='''
 
+def Quality_Stats(data):
+    '''
+    SCOPE: data quality for each CPS value, computed in one pass (no plots)
+    NOTE: a row is corrupted if QF>0 or if the number of TDC/ADC data (nData) differs from CPS
+    INPUT: data as returned by lf.Load_csv() / lf.Load_Merge_csv()
+    OUTPUT: a Pandas DataFrame indexed by CPS with: rows, corrupted (number of rows),
+            fraction (corrupted/rows), loss (mean % of ADC data lost, (CPS-nData)/CPS)
+    '''
+    CPS = data.CPS.to_numpy().astype(np.int64)
+    nData = data.nData.to_numpy().astype(np.int64)
+    corrupted = (data.QF.to_numpy() > 0) | (CPS != nData)
+    loss = np.divide((CPS-nData)*100., CPS, out=np.zeros(len(CPS)), where=CPS!=0)
+    stats = pd.DataFrame({'CPS': CPS, 'corrupted': corrupted, 'loss': loss}).groupby('CPS').agg(
+        rows=('corrupted', 'size'), corrupted=('corrupted', 'sum'), loss=('loss', 'mean'))
+    stats['fraction'] = stats.corrupted / stats.rows
+    return(stats)
+
+def Quality_Loss2D(data, nLoss=100):
+    '''
+    SCOPE: 2D histogram of CPS vs % of ADC data lost (no plots)
+    INPUT: data as returned by lf.Load_csv(), number of bins of the loss axis
+    OUTPUT: counts, CPS bin edges, loss bin edges (as np.histogram2d)
+    '''
+    CPS = data.CPS.to_numpy().astype(np.int64)
+    nData = data.nData.to_numpy().astype(np.int64)
+    loss = np.divide((CPS-nData)*100., CPS, out=np.zeros(len(CPS)), where=CPS!=0)
+    m = max(CPS.max(), 1) if len(CPS) else 1
+    return(np.histogram2d(CPS, loss, bins=(m, nLoss), range=((0.5,m+0.5),(0,100))))
+
+def Flag_Quality(data):
+    '''
+    SCOPE: increase QF (in data) for the rows where the number of TDC/ADC data (nData) differs from CPS
+    OUTPUT: the same DataFrame
+    '''
+    data.loc[data.CPS!=data.nData, 'QF'] = data.QF+1
+    return(data)
+
 def DataQuality2(data, label=None, fig=1):
-    m = max(data.CPS)
-    #r = ((-0.5,m+0.5),(0,100))
-    #b = (m+1, 100)
-    r = ((0.5,m+0.5),(0,100))
-    b = (m, 100)
+    import matplotlib.pyplot as plt
+    counts, xedges, yedges = Quality_Loss2D(data)
     plt.figure(fig)
-    nzero = 0
-    for counts in set(data.CPS):
-        ans = data.query(f'CPS=={counts}')
-        if not counts==0:
-            persi = (ans.CPS-ans.nData)/ans.CPS*100
-        else:
-            persi = np.zeros(shape=(1,len(ans.CPS)))
-        try: h = plt.hist2d(ans.CPS,persi, bins=b, range=r, cmin=1, label=label)#, density=True)
-        except:
-            print(counts)
-            #plt.show()
-            #input("Press Enter to continue...")
+    image = plt.pcolormesh(xedges, yedges, np.ma.masked_less(counts, 1).T, label=label)
     plt.xlabel('CPS')
     plt.ylabel('number of ADC loss ($-#ADC)')
     plt.colorbar()
-    return(h)
+    return(counts, xedges, yedges, image)
 
 def DataQuality(data, label=None, fig=1):
-    data.loc[data.CPS!=data.nData, 'QF'] = data.QF+1
-    x =[]
-    y = []
-    for counts in set(data.CPS):
-        ans = data.query(f'CPS=={counts}')
-        ans2 = ans.query('QF>0')
-        x.append(counts)
-        y.append(len(ans2)/len(ans))
+    '''
+    SCOPE: plot the fraction of corrupted data vs CPS, with the CPS distribution
+    NOTE: as before, QF is increased (in data) for the rows where CPS != nData
+    OUTPUT: the statistics from Quality_Stats()
+    '''
+    import matplotlib.pyplot as plt
+    Flag_Quality(data)
+    stats = Quality_Stats(data)
     #plt.figure(fig)
     fig, ax1 = plt.subplots()
 
     ax2 = ax1.twinx()
     ax2.set_ylabel('number of events')
-    ax2.hist(data.CPS, bins=max(data.CPS)+1, range=(-0.5,max(data.CPS)+0.5))
+    m = max(int(stats.index.max()), 0)
+    ax2.stairs(np.bincount(stats.index.to_numpy()[stats.index >= 0], weights=stats.rows[stats.index >= 0], minlength=m+1),
+               np.arange(-0.5, m+1), fill=True)
 
-    ax1.plot(x,y, 'bo', label=label)
+    ax1.plot(stats.index, stats.fraction, 'bo', label=label)
     ax1.set_xlabel('CPS')
     ax1.set_ylabel('corrupted data (%)')
     #ax1.title('Quality check of dataset')
+    return(stats)
 
 
 
 def BC408(directory='.', check=False, SoloCounts=False):
-    bg, t_bg = lf.Load_Merge_csv(directory, InName = 'bg')
-    w_bg = [1/t_bg.total_seconds()] * len(bg.ADC)
+    import matplotlib.pyplot as plt
+    import a_plots as plot
+    index = lf.ArduSiPM_RunIndex(directory)
+    bg, t_bg = lf.Load_Merge_csv(index=index, InName = 'bg')
 
-    therm, t_therm = lf.Load_Merge_csv(directory, InName = 'therm-TAC-100mV')
-    w_therm = [1/t_therm.total_seconds()] * len(therm.ADC)
+    therm, t_therm = lf.Load_Merge_csv(index=index, InName = 'therm-TAC-100mV')
 
-    fast, t_fast = lf.Load_Merge_csv(directory, InName = 'fast')
-    w_fast = [1/t_fast.total_seconds()] * len(fast.ADC)
+    fast, t_fast = lf.Load_Merge_csv(index=index, InName = 'fast')
 
     #Co60, t_Co60 = lf.Load_Merge_csv(directory, InName = 'Co60', OutName='SoloCounts')
-    #w_Co60 = [1/t_Co60.total_seconds()] * len(Co60.ADC)
 
-    plot.Plot_ADC(bg, label='bg', weights=w_bg, ylabel='rate', fig=1) #, log=False)
-    plot.Plot_ADC(therm, label='therm', weights=w_therm, fig=1) #, log=False)
-    plot.Plot_ADC(fast, label='fast', weights=w_fast, fig=1)
-    #plot.Plot_ADC(Co60, label='gamma (Co-60)', weights=w_Co60, fig=1)
+    plot.Plot_ADC(bg, label='bg', scale=1/t_bg.total_seconds(), ylabel='rate', fig=1) #, log=False)
+    plot.Plot_ADC(therm, label='therm', scale=1/t_therm.total_seconds(), fig=1) #, log=False)
+    plot.Plot_ADC(fast, label='fast', scale=1/t_fast.total_seconds(), fig=1)
+    #plot.Plot_ADC(Co60, label='gamma (Co-60)', scale=1/t_Co60.total_seconds(), fig=1)
     plt.ylabel('rate (counts/sec)')
     plt.legend()
 
@@ -112,22 +135,21 @@ def BC408(directory='.', check=False, SoloCounts=False):
         plt.legend()
 
 def GS20(directory='.', check=False, SoloCounts=False):
-    bg, t_bg = lf.Load_Merge_csv(directory, InName = 'bg')
-    w_bg = [1/t_bg.total_seconds()] * len(bg.ADC)
+    import matplotlib.pyplot as plt
+    import a_plots as plot
+    index = lf.ArduSiPM_RunIndex(directory)
+    bg, t_bg = lf.Load_Merge_csv(index=index, InName = 'bg')
 
-    therm, t_therm = lf.Load_Merge_csv(directory, InName = 'therm')
-    w_therm = [1/t_therm.total_seconds()] * len(therm.ADC)
+    therm, t_therm = lf.Load_Merge_csv(index=index, InName = 'therm')
 
-    fast, t_fast = lf.Load_Merge_csv(directory, InName = 'fast')
-    w_fast = [1/t_fast.total_seconds()] * len(fast.ADC)
+    fast, t_fast = lf.Load_Merge_csv(index=index, InName = 'fast')
 
     #Co60, t_Co60 = lf.Load_Merge_csv(directory, InName = 'Co60', OutName='SoloCounts')
-    #w_Co60 = [1/t_Co60.total_seconds()] * len(Co60.ADC)
 
-    plot.Plot_ADC(bg, label='bg', weights=w_bg, ylabel='rate', fig=1) #, log=False)
-    plot.Plot_ADC(therm, label='therm', weights=w_therm, fig=1) #, log=False)
-    plot.Plot_ADC(fast, label='fast', weights=w_fast, fig=1)
-    #plot.Plot_ADC(Co60, label='gamma (Co-60)', weights=w_Co60, fig=1)
+    plot.Plot_ADC(bg, label='bg', scale=1/t_bg.total_seconds(), ylabel='rate', fig=1) #, log=False)
+    plot.Plot_ADC(therm, label='therm', scale=1/t_therm.total_seconds(), fig=1) #, log=False)
+    plot.Plot_ADC(fast, label='fast', scale=1/t_fast.total_seconds(), fig=1)
+    #plot.Plot_ADC(Co60, label='gamma (Co-60)', scale=1/t_Co60.total_seconds(), fig=1)
     plt.ylabel('rate (counts/sec)')
     plt.legend()
     plt.title(directory)
@@ -149,10 +171,11 @@ def GS20(directory='.', check=False, SoloCounts=False):
         plt.title(directory)
 
 def an(InName=None, directory='.'):
+    import matplotlib.pyplot as plt
+    import a_plots as plot
     bg, t_bg = lf.Load_Merge_csv(directory, InName = InName)
-    w_bg = [1/t_bg.total_seconds()] * len(bg.ADC)
 
-    plot.Plot_ADC(bg, label=InName, weights=w_bg, ylabel='rate', fig=1)
+    plot.Plot_ADC(bg, label=InName, scale=1/t_bg.total_seconds(), ylabel='rate', fig=1)
     plt.ylabel('rate (counts/sec)')
     plt.legend()
 
@@ -161,14 +184,130 @@ def an(InName=None, directory='.'):
 
     DataQuality(bg, label=InName,fig=3)
 
-def ThresholdScan(directory='.', OutName=None):
-    for filename in sorted(os.listdir(directory)):
-        if not filename.endswith(".csv"): continue
-        if OutName and OutName in filename: continue
-        #print(f'loading file {directory}/{filename}')
-        threshold = filename.split('Scan_')[1].split('.')[0]
-        #print(filename, threshold)
-        ldata, time = lf.Load_csv(directory+"/"+filename)
-        answer = ldata.query('ADC > 16')
-        Plot_ADC(answer, label=f'threshold {threshold}',fig=1)
-        Plot_CPS(ldata, label=f'threshold {threshold}',fig=2)
+def Campaign(InName=None, directory='.', OutName=None, workers=None):
+    '''
+    SCOPE: ADC rate and CPS spectra of a campaign as sum of the cached histograms of each file
+    NOTE: as an() without loading all the events in memory, see ah.Load_Merge_Histo()
+    OUTPUT: a dict name -> ah.ArduSiPM_Histo, total acquisition time in seconds
+    '''
+    import matplotlib.pyplot as plt
+    import a_plots as plot
+    histos, exposure = ah.Load_Merge_Histo(directory, InName=InName, OutName=OutName, workers=workers)
+    plot.Plot_Histo(histos['ADC'], label=InName, xlim=(0,1000), fig=1)
+    plt.legend()
+    plot.Plot_Histo(histos['CPS'], label=InName, rate=False, xlim=(0,100), fig=2)
+    plt.legend()
+    return(histos, exposure)
+
+def Scan_Threshold(filename):
+    '''
+    SCOPE: threshold of a threshold scan run, from the file name (..._Scan_<threshold>.csv, see aaa.ScanThreshold)
+    OUTPUT: the threshold (int), None if not in the name
+    '''
+    try: return(int(os.path.basename(filename).split('Scan_')[1].split('.')[0]))
+    except (IndexError, ValueError): return(None)
+
+def Record_Starts(data):
+    '''
+    SCOPE: first row of each record (a record has one row per TDC/ADC hit)
+    NOTE: only the records with a valid time are counted, the rows of a damaged record
+          without time cannot be grouped
+    INPUT: Pandas DataFrame as from lf.Load_csv
+    OUTPUT: NumPy bool array, True at the first row of each record
+    '''
+    utime = data.UNIXTIME.to_numpy()
+    first = ~np.isnat(utime)
+    first[1:] &= (utime[1:] != utime[:-1]) | (data.nData.to_numpy()[1:] == 0)
+    return(first)
+
+def Scan_Point(filename, adc_cut=16, cache=True, cache_dir=None):
+    '''
+    SCOPE: reduce one run of a threshold scan (no plots)
+    NOTE: the parsed data come from the cache of lf.Load_File(), QF as in Flag_Quality();
+          records are counted as in Record_Starts(), the rate is the mean CPS of those records (error
+          codes excluded), the ADC rate counts the hits with ADC > adc_cut
+    INPUT: the file name, ADC cut, cache options as in lf.Load_File()
+    OUTPUT: dict with the row of the scan table, the ADC spectrum (ah.ArduSiPM_Histo, ADC > adc_cut)
+    '''
+    data, acqtime = lf.Load_File(filename, cache=cache, cache_dir=cache_dir)
+    exposure = acqtime.total_seconds() if isinstance(acqtime, timedelta) else 0.
+    Flag_Quality(data)
+    first = Record_Starts(data)
+    CPS = data.CPS.to_numpy()[first]
+    CPS = CPS[CPS >= 0] ## no error codes
+    ADC = data.ADC.to_numpy()
+    spectrum = ah.Default_Histos()['ADC']
+    spectrum.Fill(ADC[ADC > adc_cut], exposure=exposure)
+    QF = data.QF.value_counts()
+    row = {'THRESHOLD': Scan_Threshold(filename), 'FILE': os.path.basename(filename),
+           'EXPOSURE': exposure, 'RECORDS': int(first.sum()), 'ROWS': len(data),
+           'RATE': float(CPS.mean()) if len(CPS) else np.nan,
+           'ADC_RATE': spectrum.Entries/exposure if exposure > 0 else np.nan,
+           'CORRUPTED': float((data.QF > 0).mean()) if len(data) else np.nan}
+    row.update({f'QF{k}': int(v) for k, v in QF.items()})
+    return(row, spectrum)
+
+def ThresholdScan(directory='.', OutName=None, InName='Scan_', adc_cut=16, workers=None, cache=True,
+                  cache_dir=None, plot=True):
+    '''
+    SCOPE: reduction of a threshold scan (runs of aaa.ScanThreshold): threshold -> rate, ADC spectrum, QF
+    NOTE: the runs are reduced in parallel by workers processes (default: number of CPU)
+          with Scan_Point(), the parsed data of each run are cached (see lf.Load_File()),
+          so reducing again a scan only reads the caches; plots come from the tables
+          (see Plot_ThresholdScan())
+    INPUT: path to the folder with the scan files, filters, ADC cut, number of worker processes,
+           cache options, plot
+    OUTPUT: Pandas DataFrame indexed by threshold (EXPOSURE, RECORDS, ROWS, RATE, ADC_RATE,
+            CORRUPTED, QF<k> rows with each quality flag), Pandas DataFrame of the ADC
+            spectra (rate, one column per threshold, indexed by ADC channel)
+    '''
+    index = lf.ArduSiPM_RunIndex(directory)
+    files = [f for f in index.Select(InName=InName, OutName=OutName, ext='.csv') if Scan_Threshold(f) is not None]
+    if not files:
+        print(f'no threshold scan files (..._Scan_<threshold>.csv) in {directory}')
+        return(None, None)
+    if workers is None: workers = os.cpu_count() or 1
+    nf = len(files)
+    if workers > 1 and nf > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, nf)) as pool:
+            results = list(pool.map(Scan_Point, files, [adc_cut]*nf, [cache]*nf, [cache_dir]*nf))
+    else:
+        results = [Scan_Point(filename, adc_cut=adc_cut, cache=cache, cache_dir=cache_dir) for filename in files]
+    table = pd.DataFrame([row for row, spectrum in results])
+    QF = sorted((c for c in table.columns if c.startswith('QF')), key=lambda c: int(c[2:]))
+    table[QF] = table[QF].fillna(0).astype(np.int64)
+    table = table[[c for c in table.columns if not c.startswith('QF')] + QF]
+    table = table.sort_values('THRESHOLD', kind='stable').set_index('THRESHOLD')
+    edges = results[0][1].Edges
+    spectra = pd.DataFrame({row['THRESHOLD']: spectrum.Rate() for row, spectrum in results},
+                           index=pd.Index(((edges[:-1] + edges[1:])/2).astype(np.int64), name='ADC'))
+    spectra = spectra[sorted(spectra.columns)]
+    if plot: Plot_ThresholdScan(table, spectra)
+    return(table, spectra)
+
+def Plot_ThresholdScan(table, spectra, xlim=(0,1000), fig=1):
+    '''
+    SCOPE: plots of a threshold scan from the tables of ThresholdScan()
+    NOTE: rate and ADC rate vs threshold (fig), ADC spectra (fig+1), fraction of corrupted rows (fig+2)
+    '''
+    import matplotlib.pyplot as plt
+    import Utility as ut
+    plt.figure(fig)
+    plt.plot(table.index, table.RATE, 'o-', label='rate (mean CPS)')
+    plt.plot(table.index, table.ADC_RATE, 's-', label='ADC rate')
+    plt.yscale('log')
+    plt.xlabel('threshold')
+    plt.ylabel('rate (counts/sec)')
+    plt.legend()
+    edges = np.append(spectra.index.to_numpy(), spectra.index[-1] + 1) - 0.5
+    keep = (edges[:-1] >= xlim[0]) & (edges[1:] <= xlim[1])
+    for threshold in spectra.columns:
+        ut.Draw1D(spectra[threshold].to_numpy()[keep], edges[np.append(keep, False) | np.insert(keep, 0, False)],
+                  title='ADC spectra', xlabel='ADC', label=f'threshold {threshold}', c=fig+1, log=True)
+    plt.ylabel('rate (counts/sec)')
+    plt.legend()
+    plt.figure(fig+2)
+    plt.plot(table.index, table.CORRUPTED*100, 'o-')
+    plt.xlabel('threshold')
+    plt.ylabel('corrupted data (%)')
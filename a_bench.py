@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  benchmarks                   |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, throughput and peak memory of loaders       |
+|          acquisition throughput with a virtual ArduSiPM            |
+|          replay speed check of the virtual ArduSiPM                |
+ --------------------------------------------------------------------
+'''
+
+import os
+import time
+import shutil
+import tempfile
+import tracemalloc
+import pandas as pd
+import a_load as lf
+import a_synth as sy
+
+'''==================
+     Benchmarks
+=================='''
+def Bench(name, function, *args, nbytes=0, rows=None, memory=True, setup=None, **kwargs):
+    '''
+    SCOPE: time and peak memory of a call
+    NOTE: time is measured without tracemalloc (that slows down python code), the peak
+          memory in a second call with tracemalloc; memory used by worker processes
+          (e.g. Load_Merge_csv with workers) is not seen. setup() is called before both
+          calls, so that they start from the same state (e.g. an empty cache)
+    INPUT: name of the test, function and its arguments, bytes read (for MB/s),
+           rows processed (default: length of the result), memory, setup function
+    OUTPUT: dict with name, seconds, rows, rows/s, MB/s, peak MB; the function result
+    '''
+    if setup: setup()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    if rows is None:
+        data = result[0] if isinstance(result, tuple) else result
+        rows = len(data) if hasattr(data, '__len__') else 0
+        del data
+    peak = None
+    if memory:
+        result = None
+        if setup: setup()
+        tracemalloc.start()
+        result = function(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    report = {'name': name, 'seconds': seconds, 'rows': rows,
+              'rows_s': rows/seconds if seconds else None,
+              'MB_s': nbytes/1e6/seconds if seconds and nbytes else None,
+              'peak_MB': peak}
+    return(report, result)
+
+def Run_Bench(n=100000, nFiles=4, cps=10., corrupt=0.001, workers=None, memory=True, directory=None, verbose=True):
+    '''
+    SCOPE: benchmark of loaders and analysis functions on synthetic data (see a_synth)
+    NOTE: data are written in a temporary folder (removed at the end) unless directory is given;
+          the cached loads use their own temporary cache folder, emptied before the cold ones
+    INPUT: records per file, number of files, mean CPS, corrupted fraction,
+           workers of Load_Merge_csv, measure memory, folder for the data, print the table
+    OUTPUT: a Pandas DataFrame, one row per test
+    '''
+    import a_analysis as an
+    import a_histo as ah
+    temporary = directory is None
+    if temporary: directory = tempfile.mkdtemp(prefix='aaa_bench_')
+    cache_dir = tempfile.mkdtemp(prefix='aaa_bench_cache_')
+    reports = []
+    try:
+        files = sy.Synth_Campaign(directory, nFiles=nFiles, n=n, cps=cps, corrupt=corrupt, seed=1)
+        single = files[0]
+        size = os.path.getsize(single)
+        total = sum(os.path.getsize(f) for f in files)
+        legacy = os.path.join(directory, 'legacy', 'legacy.csv')
+        os.makedirs(os.path.dirname(legacy))
+        sy.Synth_File(legacy, n=n, layout='legacy', cps=cps, corrupt=corrupt, seed=1)
+        def Add(name, function, *args, **kwargs):
+            report, result = Bench(name, function, *args, memory=memory, **kwargs)
+            reports.append(report)
+            if verbose: print(f"{name:32s} {report['seconds']:8.3f} s")
+            return(result)
+        data, acqtime = Add('Load_csv', lf.Load_csv, single, nbytes=size)
+        Add('Load_csv (legacy layout)', lf.Load_csv, legacy, nbytes=os.path.getsize(legacy))
+        Add('Load_counts', lf.Load_counts, single, nbytes=size)
+        Add('Load_Merge_csv (no cache)', lf.Load_Merge_csv, directory, cache=False, workers=workers, nbytes=total)
+        Add('Load_Merge_csv (cache, cold)', lf.Load_Merge_csv, directory, cache=True, cache_dir=cache_dir,
+            workers=workers, nbytes=total, setup=lambda: shutil.rmtree(cache_dir, ignore_errors=True))
+        Add('Load_Merge_csv (cache, warm)', lf.Load_Merge_csv, directory, cache=True, cache_dir=cache_dir,
+            workers=workers, nbytes=total)
+        rows = len(data)
+        Add('Quality_Stats', an.Quality_Stats, data, rows=rows)
+        Add('Quality_Loss2D', an.Quality_Loss2D, data, rows=rows)
+        Add('Histo1D ADC', ah.Histo1D, data.ADC.to_numpy(), 1000, (0,1000), rows=rows)
+        Add('Fill_Histos', ah.Fill_Histos, ah.Default_Histos(), data, rows=rows)
+        try:
+            import matplotlib.pyplot as plt
+            import Utility as ut
+            def Plot(values):
+                result = ut.Plot1D(values, nBin=1000, R=(0,1000))
+                plt.close('all')
+                return(result)
+            Add('Plot1D ADC', Plot, data.ADC, rows=rows)
+        except ImportError:
+            print('matplotlib not available: Plot1D not measured')
+    finally:
+        if temporary: shutil.rmtree(directory, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    table = pd.DataFrame(reports).set_index('name')
+    if verbose: print(table.to_string(float_format=lambda x: f'{x:.3g}'))
+    return(table)
+
+def Run_Acquisition_Bench(rates=(100, 1000, 3000), duration=5., cps=10., max_hits=None, noise=0.001, verbose=True):
+    '''
+    SCOPE: check that the acquisition path (aq.Acquire_Stream) keeps up with a line rate
+    NOTE: a virtual ArduSiPM (a_virtual) sends synthetic lines at each rate, without the
+          limit of the baudrate; lines sent by the device are compared with the records
+          written on disk, lost = sent - written - lines still unread when the run stops
+          - sync (the first line, dropped by design by the reader: aq.SYNC_LINES), that is
+          the lines dropped by the reader or the writer; noise adds non-ASCII bytes to some lines, the
+          time index written by the writer is checked against the files (lf.Check_Time_Index)
+    INPUT: line rates (lines/s), seconds per rate, mean CPS and max hits of the lines,
+           fraction of lines with noise, print the table
+    OUTPUT: a Pandas DataFrame, one row per rate
+    '''
+    import contextlib
+    import io
+    import a_acquire as aq
+    import a_virtual as av
+    reports = []
+    directory = tempfile.mkdtemp(prefix='aaa_acq_bench_')
+    try:
+        for rate in rates:
+            device = av.ArduSiPM_Virtual(av.Synthetic_Source(cps=cps, max_hits=max_hits, seed=1),
+                                         rate=rate, limit_baud=False, noise=noise)
+            device.open()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                files = aq.Acquire_Stream(duration, device, file_par=f'bench{rate}', directory=directory)
+            seconds = time.perf_counter() - start
+            device.close()
+            unread = device.output.count(b'\n')
+            written = 0
+            for f in files:
+                with open(f) as file: written += sum(1 for line in file if not line.startswith('#'))
+            reports.append({'rate': rate, 'seconds': seconds, 'sent': device.nLines, 'written': written,
+                            'unread': unread, 'sync': aq.SYNC_LINES,
+                            'lost': device.nLines - written - unread - aq.SYNC_LINES,
+                            'index_ok': all(lf.Check_Time_Index(f) is not False for f in files),
+                            'sent_rate': device.nLines/seconds,
+                            'MB_s': device.nBytes/1e6/seconds})
+            if verbose: print(f"rate {rate:8d} lines/s: {device.nLines} sent, {written} written")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    table = pd.DataFrame(reports).set_index('rate')
+    if verbose: print(table.to_string(float_format=lambda x: f'{x:.3g}'))
+    return(table)
+
+def Run_Replay_Check(speeds=(10, 100), n=50, tolerance=0.2, verbose=True):
+    '''
+    SCOPE: check that a replayed run (replay://<datafile>?speed=N) is sent in 1/N of its recorded time
+    NOTE: a synthetic run of n records, one per second, is replayed to the end by a virtual
+          ArduSiPM (a_virtual.Open_Virtual) at each speed
+    INPUT: replay speeds, records of the run, accepted relative difference, print the table
+    OUTPUT: a Pandas DataFrame, one row per speed (ok = within tolerance)
+    '''
+    import a_virtual as av
+    reports = []
+    directory = tempfile.mkdtemp(prefix='aaa_replay_check_')
+    try:
+        filename = os.path.join(directory, 'replay.csv')
+        sy.Synth_File(filename, n=n, seed=1)
+        recorded = n - 1.
+        for speed in speeds:
+            start = time.perf_counter()
+            device = av.Open_Virtual(f'replay://{filename}?speed={speed}&limit_baud=0')
+            while not device.finished: time.sleep(0.01)
+            seconds = time.perf_counter() - start
+            device.close()
+            expected = recorded/speed
+            reports.append({'speed': speed, 'lines': device.nLines, 'seconds': seconds, 'expected': expected,
+                            'ratio': seconds/expected, 'ok': abs(seconds/expected - 1) <= tolerance})
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    table = pd.DataFrame(reports).set_index('speed')
+    if verbose: print(table.to_string(float_format=lambda x: f'{x:.3g}'))
+    return(table)
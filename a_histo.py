@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  histograms                   |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, histograms computed without matplotlib      |
+|          ArduSiPM_Histo, per-file cached histograms                |
+ --------------------------------------------------------------------
+'''
+
+import os
+import json
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import a_load as lf
+
+HISTO_VERSION = 1       ## increase it every time binning or content of Default_Histos() changes
+ADC_RANGE = (0, 4096)   ## 12 bit ADC, bins of 1 channel
+TDC_RANGE = (0, 4096)
+CPS_RANGE = (0, 2048)
+LOSS_BINS = 100         ## bins of the % of data lost (0-100)
+
+'''==================
+     Histograms
+=================='''
+def Histo1D(dataArray, nBin=0, R=(0,0), weights=None):
+    '''
+    SCOPE: 1D histogram as plain arrays (same binning of Utility.Plot1D / plt.hist)
+    NOTE: integer data with bins of width 1 are counted with np.bincount,
+          everything else with np.histogram; nothing is drawn
+    INPUT: data, number of bins, range, optional weights (better: scale the counts afterwards)
+    OUTPUT: counts (float), bin edges
+    '''
+    dataArray = np.asarray(dataArray)
+    if nBin==0 :
+        nBin = (int(max(dataArray)))
+    if tuple(R)==(0,0):
+        R = (dataArray.min()-0.5, dataArray.max()+0.5)
+    edges = np.linspace(R[0], R[1], nBin+1)
+    if np.issubdtype(dataArray.dtype, np.integer) and np.isclose((R[1]-R[0])/nBin, 1):
+        index = np.floor(dataArray - R[0]).astype(np.int64)
+        index[dataArray == R[1]] = nBin-1 ## last bin includes the right edge, as np.histogram
+        inside = (index >= 0) & (index < nBin)
+        w = None if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), index.shape)[inside]
+        counts = np.bincount(index[inside], weights=w, minlength=nBin).astype(float)
+        return(counts, edges)
+    counts, edges = np.histogram(dataArray, bins=edges, weights=weights)
+    return(counts.astype(float), edges)
+
+def Merge(histos):
+    '''
+    SCOPE: sum histograms with the same binning
+    INPUT: list of (counts, edges)
+    OUTPUT: counts, edges
+    '''
+    counts, edges = histos[0]
+    total = np.array(counts, dtype=float)
+    for c, e in histos[1:]:
+        if len(e) != len(edges) or not np.allclose(e, edges):
+            raise ValueError('histograms with different binning cannot be merged')
+        total += c
+    return(total, edges)
+
+class ArduSiPM_Histo:
+    '''
+    SCOPE: histogram (1D or 2D) that can be filled in steps (file, chunk, live data)
+           and summed, with the exposure (acquisition time in seconds) carried alongside
+    NOTE: values outside the edges are not counted (Entries counts only the filled ones)
+    INPUT: name, bin edges (and bin edges of the y axis for a 2D histogram)
+    '''
+    def __init__(self, name, edges, yedges=None):
+        self.Name = name
+        self.Edges = np.asarray(edges, dtype=float)
+        self.YEdges = None if yedges is None else np.asarray(yedges, dtype=float)
+        shape = len(self.Edges)-1 if yedges is None else (len(self.Edges)-1, len(self.YEdges)-1)
+        self.Counts = np.zeros(shape)
+        self.Exposure = 0.
+        self.Entries = 0
+
+    def Fill(self, x, y=None, exposure=0.):
+        '''
+        SCOPE: add values (and acquisition time) to the histogram
+        INPUT: x values (and y values for 2D), exposure in seconds (or timedelta)
+        '''
+        if self.YEdges is None:
+            counts, _ = Histo1D(np.asarray(x), nBin=len(self.Edges)-1, R=(self.Edges[0], self.Edges[-1]))
+        else:
+            counts, _, _ = np.histogram2d(np.asarray(x), np.asarray(y), bins=(self.Edges, self.YEdges))
+        self.Counts += counts
+        self.Entries += int(counts.sum())
+        self.Add_Exposure(exposure)
+
+    def Add_Exposure(self, exposure):
+        if isinstance(exposure, timedelta): exposure = exposure.total_seconds()
+        self.Exposure += float(exposure)
+
+    def Same_Binning(self, other):
+        if self.Counts.shape != other.Counts.shape or not np.allclose(self.Edges, other.Edges): return(False)
+        return(self.YEdges is None or np.allclose(self.YEdges, other.YEdges))
+
+    def __iadd__(self, other):
+        if not self.Same_Binning(other):
+            raise ValueError(f'histograms {self.Name} and {other.Name} with different binning cannot be summed')
+        self.Counts += other.Counts
+        self.Exposure += other.Exposure
+        self.Entries += other.Entries
+        return(self)
+
+    def __add__(self, other):
+        return(self.Copy().__iadd__(other))
+
+    def Copy(self):
+        histo = ArduSiPM_Histo(self.Name, self.Edges, self.YEdges)
+        histo += self
+        return(histo)
+
+    def Rate(self):
+        '''
+        OUTPUT: counts per second (counts if the exposure is unknown)
+        '''
+        if self.Exposure <= 0: return(self.Counts.copy())
+        return(self.Counts / self.Exposure)
+
+    def Arrays(self, prefix=''):
+        arrays = {prefix+'counts': self.Counts, prefix+'edges': self.Edges,
+                  prefix+'info': np.array([self.Exposure, self.Entries])}
+        if self.YEdges is not None: arrays[prefix+'yedges'] = self.YEdges
+        return(arrays)
+
+    def Save(self, filename):
+        '''
+        SCOPE: save the histogram on file (npz), to be reloaded with Load_Histo()
+        '''
+        with open(filename, 'wb') as file:
+            np.savez(file, name=self.Name, **self.Arrays())
+        return(filename)
+
+def _From_Arrays(name, arrays, prefix=''):
+    histo = ArduSiPM_Histo(name, arrays[prefix+'edges'], arrays.get(prefix+'yedges'))
+    histo.Counts = np.array(arrays[prefix+'counts'], dtype=float)
+    histo.Exposure, histo.Entries = float(arrays[prefix+'info'][0]), int(arrays[prefix+'info'][1])
+    return(histo)
+
+def Load_Histo(filename):
+    '''
+    SCOPE: load a histogram saved by ArduSiPM_Histo.Save()
+    OUTPUT: an ArduSiPM_Histo
+    '''
+    with np.load(filename) as file:
+        arrays = dict(file)
+    return(_From_Arrays(str(arrays['name']), arrays))
+
+'''==================
+  Campaign spectra
+=================='''
+def Default_Histos():
+    '''
+    SCOPE: the standard set of histograms of a run: ADC, TDC, CPS and CPS vs % of data lost
+    OUTPUT: a dict name -> empty ArduSiPM_Histo
+    '''
+    def Unit(R): return(np.arange(R[0], R[1]+1) - 0.5)
+    return({'ADC': ArduSiPM_Histo('ADC', Unit(ADC_RANGE)),
+            'TDC': ArduSiPM_Histo('TDC', Unit(TDC_RANGE)),
+            'CPS': ArduSiPM_Histo('CPS', Unit(CPS_RANGE)),
+            'LOSS': ArduSiPM_Histo('LOSS', Unit(CPS_RANGE), np.linspace(0, 100, LOSS_BINS+1))})
+
+def Fill_Histos(histos, data, exposure=0.):
+    '''
+    SCOPE: fill the standard histograms with a DataFrame (a file, a chunk, live data)
+    NOTE: one entry per row, as Plot_ADC()/Plot_CPS() and a_analysis.Quality_Loss2D()
+    INPUT: dict as returned by Default_Histos(), data as returned by lf.Load_csv(), exposure
+    OUTPUT: the same dict
+    '''
+    CPS = data.CPS.to_numpy().astype(np.int64)
+    nData = data.nData.to_numpy().astype(np.int64)
+    loss = np.divide((CPS-nData)*100., CPS, out=np.zeros(len(CPS)), where=CPS!=0)
+    histos['ADC'].Fill(data.ADC.to_numpy(), exposure=exposure)
+    histos['TDC'].Fill(data.TDC.to_numpy(), exposure=exposure)
+    histos['CPS'].Fill(CPS, exposure=exposure)
+    histos['LOSS'].Fill(CPS, loss, exposure=exposure)
+    return(histos)
+
+def Merge_Histos(list_of_histos):
+    '''
+    SCOPE: sum dicts of histograms (e.g. one per file)
+    OUTPUT: a dict name -> ArduSiPM_Histo
+    '''
+    total = {}
+    for histos in list_of_histos:
+        for name, histo in histos.items():
+            if name in total: total[name] += histo
+            else: total[name] = histo.Copy()
+    return(total if total else Default_Histos())
+
+def Histo_File(filename, cache=True, cache_dir=None, chunksize=lf.CHUNK_ROWS):
+    '''
+    SCOPE: the standard histograms of a datafile, read chunk by chunk
+    NOTE: memory use depends on chunksize only; histograms are cached (npz) in the
+          cache folder of lf.Load_File() and reused while size, modification time of the
+          datafile, PARSER_VERSION and HISTO_VERSION do not change
+    INPUT: the file name, use of the cache, the cache folder, rows of each chunk
+    OUTPUT: a dict name -> ArduSiPM_Histo, the exposure of the file in seconds
+    '''
+    cachefile = lf._Cache_Path(filename, cache_dir=cache_dir, kind='histo', ext='npz')
+    stat = os.stat(filename)
+    key = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'version': lf.PARSER_VERSION, 'histo': HISTO_VERSION}
+    if cache:
+        try:
+            with np.load(cachefile) as file: arrays = dict(file)
+            if json.loads(str(arrays['key'])) == key:
+                histos = {name: _From_Arrays(name, arrays, prefix=name+'_') for name in arrays['names']}
+                return(histos, float(arrays['exposure']))
+        except (OSError, ValueError, KeyError):
+            pass
+    histos = Default_Histos()
+    first = last = None
+    for chunk in lf.Load_csv_chunks(filename, chunksize=chunksize):
+        Fill_Histos(histos, chunk)
+        times = chunk.UNIXTIME.dropna()
+        if len(times):
+            if first is None: first = times.iloc[0]
+            last = times.iloc[-1]
+    if first is None:
+        print(f"    ERROR IN ACQ TIME !!! file: {filename}")
+        exposure = 0.
+    else: exposure = (last - first).total_seconds()
+    for histo in histos.values(): histo.Add_Exposure(exposure)
+    if cache:
+        try:
+            os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+            arrays = {}
+            for name, histo in histos.items(): arrays.update(histo.Arrays(prefix=name+'_'))
+            with open(cachefile, 'wb') as file:
+                np.savez(file, key=json.dumps(key), names=list(histos), exposure=exposure, **arrays)
+        except OSError as error:
+            print(f"    cache not written for file {filename}: {error}")
+    return(histos, exposure)
+
+def Load_Merge_Histo(directory=None, InName=None, OutName=None, index=None, cache=True, cache_dir=None, workers=None):
+    '''
+    SCOPE: campaign spectra as sum of the (cached) histograms of each file
+    NOTE: files are selected as in lf.Load_Merge_csv(); only new or modified files are
+          parsed again, memory does not depend on the number of events
+    INPUT: path to the folder with csv data files (or an ArduSiPM_RunIndex of it),
+           filters, cache options, number of worker processes
+    OUTPUT: a dict name -> ArduSiPM_Histo, total acquisition time in seconds
+    '''
+    if not directory and not index:
+        print('PLEASE, provide a directory to scan... ')
+        return(0,0)
+    if not index: index = lf.ArduSiPM_RunIndex(directory)
+    files = index.Select(InName=InName, OutName=OutName, ext='.csv')
+    if workers and workers > 1 and len(files) > 1:
+        nf = len(files)
+        with ProcessPoolExecutor(max_workers=min(workers, nf)) as pool:
+            results = list(pool.map(Histo_File, files, [cache]*nf, [cache_dir]*nf))
+    else:
+        results = [Histo_File(filename, cache=cache, cache_dir=cache_dir) for filename in files]
+    total = Merge_Histos([histos for histos, exposure in results])
+    exposure = sum(exposure for histos, exposure in results)
+    print(f'{len(files)} files histogrammed for {exposure} seconds of acquiring time')
+    return(total, exposure)
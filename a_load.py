@@ -15,11 +15,56 @@
 
 import sys
 import os
+import re
 import time
+import mmap
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 import csv
+import json
+import contextlib
+import numpy as np
 import pandas as pd
 
+COLUMNS = ['UNIXTIME', 'CPS', 'TDC', 'ADC', 'nData', 'QF']
+READ_BLOCK = 1<<20   ## characters read from file at once
+CHUNK_ROWS = 100000  ## rows of each DataFrame chunk
+
+## a well formed record: u<time>[t<TDC>v<ADC>]...$<CPS>, anything else goes through _Parse_Row()
+RECORD = re.compile(r'^(?:u([0-9]+(?:\.[0-9]+)?)((?:t[0-9a-fA-F]{1,8}v[0-9a-fA-F]{1,8})*)\$([0-9]{1,9})|(.*))$', re.M)
+HIT = re.compile(r't([0-9a-fA-F]+)v([0-9a-fA-F]+)')
+HEX_TABLE = np.zeros(256, dtype=np.int64)
+HEX_TABLE[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+HEX_TABLE[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+HEX_TABLE[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+## byte classes of the mmap parser, see _Parse_Block()
+MMAP_BLOCK = 1<<22   ## bytes of the file parsed at once
+OTHER, DIGIT, HEXLETTER, DOT, U, T, V, DOLLAR, SEPARATOR = range(9)
+BYTE_CLASS = np.zeros(256, dtype=np.uint8)
+BYTE_CLASS[np.frombuffer(b'0123456789', dtype=np.uint8)] = DIGIT
+BYTE_CLASS[np.frombuffer(b'abcdefABCDEF', dtype=np.uint8)] = HEXLETTER
+BYTE_CLASS[np.frombuffer(b'.utv$\n,', dtype=np.uint8)] = (DOT, U, T, V, DOLLAR, SEPARATOR, SEPARATOR)
+## '\r' is a separator only at the end of a line (see _Byte_Classes), as in Iter_Records()
+## letter -> allowed next letter (OTHER = end of the record), as in RECORD
+NEXT_LETTER = np.zeros((9, 9), dtype=bool)
+NEXT_LETTER[U, [T, DOLLAR]] = True
+NEXT_LETTER[T, V] = True
+NEXT_LETTER[V, [T, DOLLAR]] = True
+NEXT_LETTER[DOLLAR, OTHER] = True
+MAX_DIGITS = np.zeros(9, dtype=np.int64)
+MAX_DIGITS[[U, T, V, DOLLAR]] = (1<<30, 8, 8, 9)
+
+## cache of the parsed files, see Load_File()
+PARSER_VERSION = 3        ## increase it every time the output of the parsers changes
+CACHE_DIR = '.aaa_cache'  ## default cache folder, created inside the data folder
+TIME_BLOCK = 60           ## seconds of each block of the time index, see Load_Time_Index()
+try:
+    import pyarrow
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
 '''==================
      Load data from file/s
 =================='''
@@ -28,6 +73,80 @@ class ArduSiPM_MetaData:
         self.FileName = 'Not-Provided'
         self.df = pd.DataFrame(columns = ['UNIXTIME', 'CPS', 'TDC', 'ADC'])
 
+class ArduSiPM_RunIndex:
+    '''
+    SCOPE: index of the datafiles of a folder, built with a single scan of the folder
+    NOTE: file names are expected as <%y%m%d%H%M%S>_<label>.<ext> (as written by RunIt),
+          files without the time prefix get Start=NaT and the full name as label
+    INPUT: path to the folder with the data files (or a saved index, see Load_RunIndex())
+    '''
+    def __init__(self, directory='.', ext=('.csv', '.xlsx')):
+        self.Directory = directory
+        entries = []
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith(ext) or not entry.is_file(): continue
+                stat = entry.stat()
+                entries.append([entry.name, stat.st_size, stat.st_mtime])
+        self.df = pd.DataFrame(entries, columns=['FileName', 'Size', 'MTime']).sort_values('FileName', ignore_index=True)
+        self._Fill()
+
+    def _Fill(self):
+        ## <prefix>_<label>.<ext>, extract() keeps the columns also when there are no files
+        name = self.df.FileName.astype(str).str.extract(r'^(?P<stem>(?P<prefix>[^_]*)_?(?P<label>.*))\.(?P<ext>[^.]*)$')
+        self.df['Ext'] = '.' + name.ext
+        self.df['Start'] = pd.to_datetime(name.prefix, format='%y%m%d%H%M%S', errors='coerce').astype('datetime64[ns]')
+        self.df['Label'] = name.label.where(self.df.Start.notna(), name.stem)
+        ## modification time (last write) as local time, as the prefix
+        mtime = pd.to_datetime(self.df.MTime, unit='s', utc=True)
+        self.df['End'] = mtime.dt.tz_convert(datetime.now().astimezone().tzinfo).dt.tz_localize(None)
+
+    def Select(self, InName=None, OutName=None, start=None, stop=None, ext='.csv', verbose=False):
+        '''
+        SCOPE: select files as Load_Merge_csv() does (InName/OutName are substrings of the file name)
+        NOTE: start/stop select the files acquired (at least partially) in [start, stop),
+              using the time prefix as start and the modification time as end of the run
+        INPUT: filters; start, stop as datetime or str
+        OUTPUT: list of paths, sorted by file name
+        '''
+        df = self.df
+        keep = (df.Ext == ext) & ~df.FileName.str.contains('~', regex=False)
+        if InName: keep &= df.FileName.str.contains(InName, regex=False)
+        if OutName: keep &= ~df.FileName.str.contains(OutName, regex=False)
+        if start is not None: keep &= df.End >= pd.Timestamp(start)
+        if stop is not None: keep &= df.Start < pd.Timestamp(stop)
+        if verbose:
+            for filename in df.FileName[(df.Ext == ext) & ~keep]: print("skipping " + filename)
+        elif (InName or OutName or start or stop) and (~keep & (df.Ext == ext)).any():
+            print(f"skipping {(~keep & (df.Ext == ext)).sum()} files")
+        return([os.path.join(self.Directory, filename) for filename in df.FileName[keep]])
+
+    def Save(self, filename=None):
+        '''
+        SCOPE: save the index on file (json), to be reloaded with Load_RunIndex()
+        INPUT: the file name, default is <directory>/CACHE_DIR/runindex.json
+        OUTPUT: the file name
+        '''
+        if not filename: filename = os.path.join(self.Directory, CACHE_DIR, 'runindex.json')
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(filename, 'w') as file:
+            json.dump({'Directory': self.Directory,
+                       'Files': self.df[['FileName', 'Size', 'MTime']].values.tolist()}, file)
+        return(filename)
+
+def Load_RunIndex(filename):
+    '''
+    SCOPE: reload an index saved with ArduSiPM_RunIndex.Save()
+    INPUT: the file name of the saved index
+    OUTPUT: an ArduSiPM_RunIndex
+    '''
+    with open(filename, 'r') as file: saved = json.load(file)
+    index = ArduSiPM_RunIndex.__new__(ArduSiPM_RunIndex)
+    index.Directory = saved['Directory']
+    index.df = pd.DataFrame(saved['Files'], columns=['FileName', 'Size', 'MTime'])
+    index._Fill()
+    return(index)
+
 def Load_Curti_xlsx(filename=None):
     '''
     SCOPE: load data from a xlsx datafile generated from Curti acquisition program
@@ -49,38 +168,52 @@ def Load_Curti_xlsx(filename=None):
         print(f'NO TDC/ADC information in file {filename}')
         return(0)
 
-def Load_Merge_xlsx(directory=None, InName=None, OutName=None):
+def Load_Merge_xlsx(directory=None, InName=None, OutName=None, index=None):
     '''
     SCOPE:
-    INPUT: path to the folder with xlsx data files
+    INPUT: path to the folder with xlsx data files (or an ArduSiPM_RunIndex of it)
     OUTPUT: a Pandas DataFrame
     '''
     #TODO: return an ArduSiPM_MetaData
-    if not directory:
+    if not directory and not index:
         print('PLEASE, provide a directory to scan... ')
         return(0,0)
+    if not index: index = ArduSiPM_RunIndex(directory)
     nFile = 0
     data = []
-    slash = '/'
     if(InName): print(f"I will skip all files that does NOT contain {InName}")
     if(OutName): print(f"I will skip all files that does contain {OutName}")
     ## loops on the files of the directory
-    for filename in os.listdir(directory):
-        if filename.endswith(".xlsx"):
-            if InName and InName not in filename:
-                print("skipping " + filename)
-                continue
-            if '~' in filename: continue
-            if OutName and OutName in filename:
-                print("skipping " + filename)
-                continue
-            nFile = nFile+1
-            # loading and filtering data:
-            print(f'loading file {directory+slash+filename}')
-            data.append(Load_Curti_xlsx(directory+"/"+filename)) #this is a list of DataFraMe
+    for filename in index.Select(InName=InName, OutName=OutName, ext='.xlsx'):
+        nFile = nFile+1
+        # loading and filtering data:
+        print(f'loading file {filename}')
+        data.append(Load_Curti_xlsx(filename)) #this is a list of DataFraMe
     TheData = pd.concat(data, ignore_index=True) #this is a DataFrame
     return(TheData)
 
+def Iter_Records(filename, blocksize=READ_BLOCK):
+    '''
+    SCOPE: iterate over the raw records of a datafile without loading it whole
+    NOTE: both the line-oriented format written by Save_Data() and the legacy
+          comma-joined one (the full run on a single line) are accepted,
+          comment lines (starting with '#', e.g. the run header of aq.ArduSiPM_Session) are skipped
+    INPUT: the file name, the size (in characters) of each buffered read
+    OUTPUT: a generator of records (str)
+    '''
+    tail = ''
+    with open(filename, 'r', newline='') as file: ## only '\n' and ',' split the records ('\r' is stripped)
+        while True:
+            block = file.read(blocksize)
+            if not block: break
+            records = (tail + block).replace('\n', ',').split(',')
+            tail = records.pop() ## last record may continue in the next block
+            for record in records:
+                record = record.strip()
+                if record and record[0] != '#': yield record
+    tail = tail.strip()
+    if tail and tail[0] != '#': yield tail
+
 def Load_csv_old(filename=None):
     '''
     SCOPE: load data from a CSV datafile generated from the Save_Data() function
@@ -94,36 +227,491 @@ def Load_csv_old(filename=None):
         print("file not .csv, please provide a valid filename")
         return(0)
     ddata = []
-    with open(filename, 'r') as file:
-        #rawdata = csv.reader(file, delimiter=',')
-        for line in file: rawdata = line.split(',')
-        for row in rawdata:
-            dolpos = row.find('$')
-            tpos = row.find('t')
-            #vpos = row.find('v')
-            ## only data with a valid time are imported
-            if (dolpos <=1): continue
-            CPS = row[dolpos+1]
-            #print('row is '+ row)
-            data = row[:dolpos]
-            if not (data[0] == 't'): continue
-            if(tpos==0):
-              lista=data[1:].split('t')
-              for i in range(0,len(lista)):
-                  vlista = lista[i].split('v')
-                  TDC = vlista[0]
-                  ADC = vlista[1]
-                  #print(row,CPS,TDC,ADC)
-                  ddata.append([0,int(CPS),int(TDC,16),int(ADC,16)])
+    for row in Iter_Records(filename):
+        dolpos = row.find('$')
+        tpos = row.find('t')
+        #vpos = row.find('v')
+        ## only data with a valid time are imported
+        if (dolpos <=1): continue
+        CPS = row[dolpos+1]
+        #print('row is '+ row)
+        data = row[:dolpos]
+        if not (data[0] == 't'): continue
+        if(tpos==0):
+          lista=data[1:].split('t')
+          for i in range(0,len(lista)):
+              vlista = lista[i].split('v')
+              TDC = vlista[0]
+              ADC = vlista[1]
+              #print(row,CPS,TDC,ADC)
+              ddata.append([0,int(CPS),int(TDC,16),int(ADC,16)])
     TheData = pd.DataFrame(ddata, columns=['UNIXTIME', 'CPS', 'TDC', 'ADC'])
     #TheData.df = TheData.df.concat(ddata, ignore_index=True)
     #return(TheData)
     return(TheData)
 
-def Load_csv(filename=None, debug=False):
+def _Check_Time(utime):
+    '''
+    SCOPE: check of the time string of a record, as done when UNIXTIME was a float
+    INPUT: the time string
+    OUTPUT: the time string (raise ValueError if not valid)
+    '''
+    float(utime)
+    return(utime)
+
+def _Int(text, base=10, default=-3):
+    '''
+    SCOPE: integer value of a field of a corrupted record
+    INPUT: the field (str), its base, the value if it is not a number (-3: not available, as in _Parse_Row())
+    OUTPUT: the int
+    '''
+    try: return(int(text, base))
+    except ValueError: return(default)
+
+def _Parse_Row(row, filename=None, debug=False):
+    '''
+    SCOPE: parse a single record of a datafile generated from Save_Data()
+    INPUT: the record (str), the file name (only for messages)
+    OUTPUT: a list of [UNIXTIME, CPS, TDC, ADC, nData, QF] rows (one per TDC/ADC hit),
+            UNIXTIME is still the time string (None if not valid), see _Parse_Time()
+    '''
+    ddata = []
+    if debug:
+        print('')
+        print(f'row is {row}')
+    CPS = '-3'
+    TDC = '-3'
+    ADC = '-3'
+    lista = '0'
+    QF = 0 ## Quality factor, if zero --> data are perfect as expected
+    dolpos = row.find('$')
+    tpos = row.find('t')
+    vpos = row.find('v')
+    upos = row.find('u')
+    pos = (upos, tpos, vpos, dolpos)
+    datastart = min((i for i in pos if i>0), default=0)
+    if debug: print(f'positions are: {datastart} {pos}')
+    ## only data with a valid time are imported
+    if (dolpos <=1):
+        QF = QF +1
+        ddata.append([None,int(CPS),int(TDC,16),int(ADC,16),int(0),int(QF)])
+        return(ddata)
+    CPS = row[dolpos+1:]
+    utime = row[upos+1:datastart]
+    #data = row[datastart+1:dolpos-1] ## !!! NOTA: uncomment this and comment below if Firmware is < 2.6
+    data = row[datastart+1:dolpos]
+    if debug: print(f'data is {data}')
+    if tpos>0 and vpos < tpos:
+        QF = QF +1
+        if debug: print(f"data is corrupted. Row is: {row}, {filename}")
+        try:
+            if debug: print(f'scrivo: [{float(utime)},{int(CPS)},{int(TDC,16)},{int(ADC,16)},{int(len(lista))}]')
+            ADC = '-5'
+            ddata.append([_Check_Time(utime),int(CPS),int(TDC,16),int(ADC,16),int(len(lista)),int(QF)])
+        except:
+                print("data is corrupted")
+                print(f'row is {row}')
+                print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
+                ddata.append([None,_Int(CPS),_Int(TDC,16),_Int(ADC,16),int(len(lista)),int(QF)])
+        return(ddata)
+    if datastart == dolpos:
+        try:
+            if debug: print(f'scrivo: [{float(utime)},{int(CPS)},{int(TDC,16)},{int(ADC,16)},{int(0)}]')
+            ddata.append([_Check_Time(utime),int(CPS),int(TDC,16),int(ADC,16),int(0),int(QF)])
+        except:
+            QF = QF +1
+            print("data is corrupted")
+            print(f'row is {row}')
+            print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
+            ddata.append([None,_Int(CPS),_Int(TDC,16),_Int(ADC,16),int(len(lista)),int(QF)])
+    elif datastart == tpos:
+        lista=data.split('t')
+        #if debug: print(f'lista is : {lista}')
+        for i in range(0,len(lista)):
+          vlista = lista[i].split('v')
+          if vlista[0]: TDC = vlista[0]
+          if len(vlista) < 2: ## hit without 'v': corrupted record
+              QF = QF + 1
+              ADC = '-3'
+          elif vlista[1]: ADC = vlista[1]
+          if _Int(ADC, 16) > 255:
+              if int(ADC[2], 16)==1:
+                  print(f"    PROBLEM WITH ADC ???  file: {filename}")
+                  ADC='-4'
+          #if debug: print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
+          try:
+            if debug: print(f'scrivo: [{float(utime)},{int(CPS)},{int(TDC,16)},{int(ADC,16)},{int(len(lista))}]')
+            ddata.append([_Check_Time(utime),int(CPS),int(TDC,16),int(ADC,16),int(len(lista)),int(QF)])
+          except:
+                QF = QF + 1
+                print("data is corrupted")
+                print(f'row is {row}')
+                print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
+                ddata.append([None,_Int(CPS),_Int(TDC,16),_Int(ADC,16),int(len(lista)),int(QF)])
+    elif datastart == vpos:
+        for i in range(0,len(data)):
+            vlista = data.split('v')
+            ## TODO
+    return(ddata)
+
+def _Parse_Time(values):
+    '''
+    SCOPE: vectorized conversion of the time strings (%y%m%d%H%M%S.%f) to datetime64[ns]
+    NOTE: strings are converted digit by digit with NumPy, only the ones not in the
+          expected layout go through pd.to_datetime()
+    INPUT: array-like of str (None where the time is missing), or a NumPy bytes array
+    OUTPUT: a NumPy datetime64[ns] array, NaT where the time is missing or not valid
+    '''
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'S':
+        times = np.full(len(values), np.datetime64('NaT', 'ns'))
+        known = np.ones(len(values), dtype=bool)
+        text = values
+    else:
+        values = np.asarray(values, dtype=object)
+        times = np.full(len(values), np.datetime64('NaT', 'ns'))
+        known = np.not_equal(values, None)
+        if not known.any(): return(times)
+        text = np.asarray(values[known].tolist(), dtype='S')
+    if not len(text): return(times)
+    if text.dtype.itemsize < 19: text = text.astype('S19')
+    digits = text.view(np.uint8).reshape(len(text), -1)[:, :19].astype(np.int64) - ord('0')
+    lengths = np.char.str_len(text)
+    fraction = np.arange(6)[None, :] < (lengths - 13)[:, None]
+    layout = ((lengths >= 13) & (lengths <= 19) & (digits[:, 12] == ord('.') - ord('0'))
+              & ((digits[:, :12] >= 0) & (digits[:, :12] <= 9)).all(axis=1)
+              & (((digits[:, 13:] >= 0) & (digits[:, 13:] <= 9)) | ~fraction).all(axis=1))
+    d = np.where(layout[:, None], digits, 0)
+    pair = lambda i: d[:, i]*10 + d[:, i+1]
+    year, month, day = 2000 + pair(0), pair(2), pair(4)
+    micro = (np.where(fraction, d[:, 13:], 0) * 10**np.arange(5, -1, -1)).sum(axis=1)
+    month_start = ((year - 1970)*12 + np.clip(month, 1, 12) - 1).astype('datetime64[M]')
+    days_in_month = ((month_start + 1).astype('datetime64[D]') - month_start.astype('datetime64[D]')).astype(np.int64)
+    layout &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month)
+    layout &= (pair(6) < 24) & (pair(8) < 60) & (pair(10) < 60)
+    ns = ((pair(6)*3600 + pair(8)*60 + pair(10))*1000000 + micro)*1000
+    parsed = month_start.astype('datetime64[ns]') + ((day - 1)*86400*10**9 + ns).astype('timedelta64[ns]')
+    parsed[~layout] = np.datetime64('NaT', 'ns')
+    if not layout.all():
+        other = np.char.decode(text[~layout], 'latin-1')
+        parsed[~layout] = pd.to_datetime(other, format='%y%m%d%H%M%S.%f', errors='coerce').as_unit('ns').to_numpy()
+    times[known] = parsed
+    return(times)
+
+def _Acq_Time(times):
+    '''
+    SCOPE: acquisition time of a run, from the first to the last valid time
+    INPUT: the UNIXTIME column (datetime64)
+    OUTPUT: a Pandas Timedelta (raise ValueError if there are no valid times)
+    '''
+    valid = times.dropna()
+    if not len(valid): raise ValueError('no valid time')
+    return(valid.iloc[-1] - valid.iloc[0])
+
+def _Hex_to_int(values):
+    '''
+    SCOPE: vectorized int(x, 16) over an array of hexadecimal strings
+    INPUT: array-like of str (at most 15 digits each)
+    OUTPUT: a NumPy int64 array
+    '''
+    digits = np.asarray(values, dtype='S')
+    if len(digits) == 0: return(np.zeros(0, dtype=np.int64))
+    width = digits.dtype.itemsize
+    lengths = np.char.str_len(digits)
+    nibbles = HEX_TABLE[digits.view(np.uint8).reshape(len(digits), width)]
+    power = lengths[:, None] - 1 - np.arange(width)
+    weight = np.where(power >= 0, np.left_shift(1, 4*np.clip(power, 0, None)), 0)
+    return((nibbles * weight).sum(axis=1))
+
+def _Parse_Records(records, filename=None, debug=False, keep_index=False):
+    '''
+    SCOPE: parse a block of records at once (bulk version of _Parse_Row)
+    NOTE: well formed records are parsed column-wise, the others fall back
+          to _Parse_Row() so that the quality flags are the same
+    INPUT: a list of records (str), the file name (only for messages),
+           keep_index: the index of the rows is the position of their record in the list
+    OUTPUT: a Pandas DataFrame with the COLUMNS, in the order of the records
+    '''
+    frames = []
+    if debug or not records: good = np.zeros(len(records), dtype=bool)
+    else:
+        fields = np.array(RECORD.findall('\n'.join(records)), dtype=object).reshape(-1, 4)
+        good = fields[:, 3] == ''
+    if good.any():
+        index = np.flatnonzero(good)
+        utime = _Parse_Time(fields[good, 0])
+        CPS = np.array(fields[good, 2].tolist(), dtype=np.int64)
+        hits = fields[good, 1]
+        nData = np.fromiter((h.count('t') for h in hits), dtype=np.int64, count=len(hits))
+        ## records with counts only
+        empty = nData == 0
+        frames.append(pd.DataFrame({'UNIXTIME': utime[empty], 'CPS': CPS[empty],
+                                    'TDC': -3, 'ADC': -3, 'nData': 0, 'QF': 0},
+                                   index=index[empty], columns=COLUMNS))
+        ## records with TDC/ADC hits: one row for each hit
+        full = ~empty
+        tokens = np.array(HIT.findall(''.join(hits[full])), dtype=object).reshape(-1, 2)
+        if len(tokens):
+            TDC = _Hex_to_int(tokens[:, 0])
+            ADCstr = np.array(tokens[:, 1], dtype='S')
+            ADC = _Hex_to_int(ADCstr)
+            third = ADCstr.view(np.uint8).reshape(len(ADCstr), -1)[:, 2] if ADCstr.dtype.itemsize > 2 else np.zeros(len(ADC))
+            bad = (ADC > 255) & (third == ord('1'))
+            if bad.any():
+                print(f"    PROBLEM WITH ADC ??? ({bad.sum()} hits) file: {filename}")
+                ADC[bad] = -4
+            nHit = nData[full]
+            frames.append(pd.DataFrame({'UNIXTIME': np.repeat(utime[full], nHit),
+                                        'CPS': np.repeat(CPS[full], nHit),
+                                        'TDC': TDC, 'ADC': ADC,
+                                        'nData': np.repeat(nHit, nHit), 'QF': 0},
+                                       index=np.repeat(index[full], nHit), columns=COLUMNS))
+    for i in np.flatnonzero(~good):
+        ddata = _Parse_Row(records[i], filename=filename, debug=debug)
+        if not ddata: continue
+        ddata = pd.DataFrame(ddata, index=[i]*len(ddata), columns=COLUMNS)
+        ddata['UNIXTIME'] = _Parse_Time(ddata.UNIXTIME.to_numpy())
+        frames.append(ddata)
+    if not frames: return(pd.DataFrame({c: pd.Series(dtype='datetime64[ns]' if c == 'UNIXTIME' else np.int64) for c in COLUMNS}))
+    TheData = pd.concat(frames).sort_index(kind='stable')
+    if not keep_index: TheData = TheData.reset_index(drop=True)
+    return(TheData.astype({c: np.int64 for c in COLUMNS[1:]}))
+
+def _Bytes_to_int(buf, start, length, base=16):
+    '''
+    SCOPE: vectorized int(field, base) of many fields of a byte buffer (digits already checked)
+    NOTE: one pass for each digit position, no per-field objects are created
+    INPUT: NumPy uint8 array, start and length of each field, base (10 or 16)
+    OUTPUT: a NumPy int64 array
+    '''
+    value = np.zeros(len(start), dtype=np.int64)
+    if not len(start): return(value)
+    last = len(buf) - 1
+    for j in range(int(length.max())):
+        inside = j < length
+        digit = HEX_TABLE[buf[np.minimum(start + j, last)]]
+        value = np.where(inside, value*base + digit, value)
+    return(value)
+
+def _Bytes_to_text(buf, start, length):
+    '''
+    SCOPE: copy many fields of a byte buffer into a NumPy bytes array (e.g. the time strings)
+    INPUT: NumPy uint8 array, start and length of each field
+    OUTPUT: a NumPy array of dtype S<longest field>
+    '''
+    width = max(int(length.max()), 1) if len(start) else 1
+    text = np.zeros((len(start), width), dtype=np.uint8)
+    for j in range(width):
+        inside = j < length
+        text[inside, j] = buf[start[inside] + j]
+    return(text.view(f'S{width}').ravel())
+
+def _Byte_Classes(buf):
+    '''
+    SCOPE: class of each byte of a block for the mmap parser (see BYTE_CLASS)
+    NOTE: a '\\r' ending a line (before '\\n' or at the end of the block) is a separator,
+          a stray one inside a record is not: records are the same as in Iter_Records()
+    INPUT: NumPy uint8 array
+    OUTPUT: NumPy uint8 array of byte classes
+    '''
+    cls = BYTE_CLASS[buf]
+    cr = np.flatnonzero(buf == ord('\r'))
+    if len(cr):
+        after = buf[np.minimum(cr + 1, len(buf) - 1)]
+        cr = cr[(cr + 1 == len(buf)) | (after == ord('\n'))]
+        cls[cr] = SEPARATOR
+    return(cls)
+
+def _Parse_Block(buf, out, at, filename=None):
+    '''
+    SCOPE: parse a block of a datafile at byte level (see _Parse_File)
+    NOTE: records are split at '\\n' and ',' ('\\r' only at the end of a line, see _Byte_Classes);
+          the records matching RECORD are checked
+          and converted column-wise from the bytes, the others (damaged, with blanks, ...)
+          are decoded and parsed by _Parse_Records(), so output and quality flags are the same;
+          empty records and comments ('#') are skipped
+    INPUT: NumPy uint8 array with whole records, the output arrays (dict column -> array)
+           and the first row to fill, the file name (only for messages)
+    OUTPUT: number of rows written in out
+    '''
+    N = len(buf)
+    if not N: return(0)
+    cls = _Byte_Classes(buf)
+    separators = np.flatnonzero(cls == SEPARATOR)
+    starts = np.concatenate(([0], separators + 1))
+    ends = np.append(separators, N)
+    nRec = len(starts)
+    first = buf[np.minimum(starts, N-1)]
+    skip = (ends == starts) | (first == ord('#'))
+    ## letters (u, t, v, $), their record and the field that follows each one
+    letters = np.flatnonzero((cls >= U) & (cls <= DOLLAR))
+    kind = cls[letters]
+    record = np.searchsorted(starts, letters, side='right') - 1
+    same = np.append(record[1:] == record[:-1], False)
+    following = np.where(same, np.append(kind[1:], OTHER), OTHER)
+    fieldend = np.where(same, np.append(letters[1:], 0), ends[record])
+    length = fieldend - letters - 1
+    ## content of the fields from prefix counts of the bytes that are not allowed
+    def Count(mask):
+        count = np.zeros(N + 1, dtype=np.int32)
+        np.cumsum(mask, out=count[1:])
+        return(count[fieldend] - count[letters + 1])
+    nothex = Count((cls != DIGIT) & (cls != HEXLETTER))
+    notdigit = Count(cls != DIGIT)
+    dots = Count(cls == DOT)
+    del cls
+    ok = NEXT_LETTER[kind, following] & (length >= 1) & (length <= MAX_DIGITS[kind])
+    ok &= np.where(kind == U, notdigit == dots, True) & (dots <= np.where(kind == U, 1, 0))
+    ok &= np.where(kind == DOLLAR, notdigit == 0, nothex == (kind == U)*dots)
+    inner = np.minimum(letters + 1, N - 1), np.maximum(fieldend - 1, 0)
+    ok &= (kind != U) | ((buf[inner[0]] != ord('.')) & (buf[inner[1]] != ord('.')))
+    good = (first == ord('u')) & ~skip
+    good[record[~ok]] = False
+    ## well formed records
+    use = good[record]
+    kind, record, start, length = kind[use], record[use], letters[use] + 1, length[use]
+    index = np.flatnonzero(good)
+    utime = _Parse_Time(_Bytes_to_text(buf, start[kind == U], length[kind == U]))
+    CPS = _Bytes_to_int(buf, start[kind == DOLLAR], length[kind == DOLLAR], base=10)
+    TDC = _Bytes_to_int(buf, start[kind == T], length[kind == T])
+    ADC = _Bytes_to_int(buf, start[kind == V], length[kind == V])
+    third = buf[np.minimum(start[kind == V] + 2, N - 1)]
+    problem = (ADC > 255) & (length[kind == V] > 2) & (third == ord('1'))
+    if problem.any():
+        print(f"    PROBLEM WITH ADC ??? ({problem.sum()} hits) file: {filename}")
+        ADC[problem] = -4
+    hitrecord = record[kind == T]
+    nData = np.bincount(hitrecord, minlength=nRec)
+    ## the other records, as _Parse_Records() does
+    other = np.flatnonzero(~good & ~skip)
+    rows = np.zeros(nRec, dtype=np.int64)
+    rows[index] = np.maximum(nData[index], 1)
+    if len(other):
+        texts = [buf[starts[i]:ends[i]].tobytes().decode('utf-8', errors='replace').strip() for i in other]
+        keep = [i for i, text in enumerate(texts) if text and text[0] != '#']
+        fallback = _Parse_Records([texts[i] for i in keep], filename=filename, keep_index=True)
+        fallrecord = other[keep][fallback.index.to_numpy()]
+        rows += np.bincount(fallrecord, minlength=nRec)
+    offset = at + np.cumsum(rows) - rows
+    def Place(recs):
+        return(offset[recs] + np.arange(len(recs)) - np.searchsorted(recs, recs, side='left'))
+    empty = index[nData[index] == 0]
+    pos = offset[empty]
+    out['UNIXTIME'][pos] = utime[nData[index] == 0]
+    out['CPS'][pos] = CPS[nData[index] == 0]
+    for c, value in (('TDC', -3), ('ADC', -3), ('nData', 0), ('QF', 0)): out[c][pos] = value
+    pos = Place(hitrecord)
+    full = np.searchsorted(index, hitrecord)
+    out['UNIXTIME'][pos] = utime[full]
+    out['CPS'][pos] = CPS[full]
+    out['TDC'][pos] = TDC
+    out['ADC'][pos] = ADC
+    out['nData'][pos] = nData[hitrecord]
+    out['QF'][pos] = 0
+    if len(other) and len(fallback):
+        pos = Place(fallrecord)
+        for c in COLUMNS: out[c][pos] = fallback[c].to_numpy()
+    return(int(rows.sum()))
+
+def _Close_Map(mm):
+    '''
+    SCOPE: close a memory mapped file once the NumPy views on it are dropped
+    NOTE: when a parser raised, its frames in the traceback still hold views on the map
+          and close() would replace the real error with a BufferError: the map is then
+          left to be released with the last view
+    INPUT: the mmap
+    '''
+    try: mm.close()
+    except BufferError: pass
+
+def _Blocks(mm, begin, end):
+    '''
+    SCOPE: split a byte range of a memory mapped file in blocks of about MMAP_BLOCK bytes,
+           each one ending at a record separator
+    INPUT: the mmap, first and last+1 byte
+    OUTPUT: list of (start, end)
+    '''
+    blocks = []
+    start = begin
+    while start < end:
+        stop = min(start + MMAP_BLOCK, end)
+        if stop < end:
+            cut = max(mm.rfind(b'\n', start, stop), mm.rfind(b',', start, stop))
+            if cut < 0: ## a record longer than the block
+                found = [p for p in (mm.find(b'\n', stop, end), mm.find(b',', stop, end)) if p >= 0]
+                cut = min(found) if found else end - 1
+            stop = cut + 1
+        blocks.append((start, stop))
+        start = stop
+    return(blocks)
+
+def _Parse_File(filename, begin=0, end=None):
+    '''
+    SCOPE: parse a whole datafile (or a byte range of it) at byte level, without decoding it to str
+    NOTE: the file is memory mapped and parsed in blocks of MMAP_BLOCK bytes (ending
+          at a record separator) into NumPy arrays allocated once for the whole file
+          (at most one row per record plus one per 't'); see _Parse_Block()
+    INPUT: the file name, first and last+1 byte to parse (at record boundaries, see Load_Time_Index())
+    OUTPUT: a Pandas DataFrame with the COLUMNS (as _Parse_Records())
+    '''
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if begin >= end: return(_Parse_Records([]))
+        mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        blocks = _Blocks(mm, begin, end)
+        nRows = 0
+        for start, stop in blocks:
+            block = buf[start:stop]
+            nRows += 1 + int(np.count_nonzero(block == ord('t'))) + int(np.count_nonzero(BYTE_CLASS[block] == SEPARATOR))
+        out = {c: np.empty(nRows, dtype='datetime64[ns]' if c == 'UNIXTIME' else np.int64) for c in COLUMNS}
+        at = 0
+        for start, stop in blocks:
+            at += _Parse_Block(buf[start:stop], out, at, filename=filename)
+    finally:
+        block = buf = None
+        _Close_Map(mm)
+    return(pd.DataFrame({c: out[c][:at] for c in COLUMNS}, copy=False))
+
+def Load_csv_chunks(filename=None, chunksize=CHUNK_ROWS, debug=False):
+    '''
+    SCOPE: load data from a CSV datafile generated from the Save_Data() function, chunk by chunk
+    NOTE: memory use depends on chunksize only, not on the length of the run
+    INPUT: the file name of the csv datafile, the number of rows of each chunk
+    OUTPUT: a generator of Pandas DataFrame with (at most) chunksize rows
+    '''
+    records = []
+    pending = None
+    for row in Iter_Records(filename):
+        records.append(row)
+        if len(records) < chunksize: continue
+        chunk = _Parse_Records(records, filename=filename, debug=debug)
+        records = []
+        if pending is not None: chunk = pd.concat([pending, chunk], ignore_index=True)
+        while len(chunk) >= chunksize:
+            yield chunk.iloc[:chunksize].reset_index(drop=True)
+            chunk = chunk.iloc[chunksize:]
+        pending = chunk
+    if records:
+        chunk = _Parse_Records(records, filename=filename, debug=debug)
+        if pending is not None: chunk = pd.concat([pending, chunk], ignore_index=True)
+        pending = chunk
+    while pending is not None and len(pending):
+        yield pending.iloc[:chunksize].reset_index(drop=True)
+        pending = pending.iloc[chunksize:]
+
+def Load_csv(filename=None, debug=False, chunksize=CHUNK_ROWS, use_mmap=True, start=None, stop=None,
+             cache=True, cache_dir=None):
     '''
     SCOPE: load data from a CSV datafile generated from the Save_Data() function
-    INPUT: the file name of the csv datafile
+    NOTE: by default the file is parsed at byte level from a memory map (_Parse_File),
+          use_mmap=False (or debug) reads it as text chunk by chunk (Load_csv_chunks);
+          with start/stop only the rows with time in [start, stop) are returned: the
+          time index of the file (Load_Time_Index) gives the bytes to parse, the rest of
+          the file is not read (rows without a valid time are dropped)
+    INPUT: the file name of the csv datafile, start, stop (datetime or str),
+           use of the time index sidecar and its folder (cache options as in Load_File())
     OUTPUT: a Pandas DataFrame
     '''
     if not filename:
@@ -132,98 +720,26 @@ def Load_csv(filename=None, debug=False):
     if not filename.endswith(".csv"):
         print("file not .csv, please provide a valid filename")
         return(0)
-    ddata = []
-    with open(filename, 'r') as file:
-        #rawdata = csv.reader(file, delimiter=',')
-        for line in file: rawdata = line.split(',')
-        for row in rawdata:
-            if not row: continue
-            if debug:
-                print('')
-                print(f'row is {row}')
-            CPS = '-3'
-            TDC = '-3'
-            ADC = '-3'
-            lista = '0'
-            QF = 0 ## Quality factor, if zero --> data are perfect as expected
-            dolpos = row.find('$')
-            tpos = row.find('t')
-            vpos = row.find('v')
-            upos = row.find('u')
-            pos = (upos, tpos, vpos, dolpos)
-            datastart = min(i for i in pos if i>0)
-            if debug: print(f'positions are: {datastart} {pos}')
-            ## only data with a valid time are imported
-            if (dolpos <=1):
-                QF = QF +1
-                ddata.append([float(0),int(CPS),int(TDC,16),int(ADC,16),int(0),int(QF)])
-                continue
-            CPS = row[dolpos+1:]
-            utime = row[upos+1:datastart]
-            #data = row[datastart+1:dolpos-1] ## !!! NOTA: uncomment this and comment below if Firmware is < 2.6
-            data = row[datastart+1:dolpos]
-            if debug: print(f'data is {data}')
-            if tpos>0 and vpos < tpos:
-                QF = QF +1
-                if debug: print(f"data is corrupted. Row is: {row}, {filename}")
-                try:
-                    if debug: print(f'scrivo: [{float(utime)},{int(CPS)},{int(TDC,16)},{int(ADC,16)},{int(len(lista))}]')
-                    ADC = '-5'
-                    ddata.append([float(utime),int(CPS),int(TDC,16),int(ADC,16),int(len(lista)),int(QF)])
-                except:
-                        print("data is corrupted")
-                        print(f'row is {row}')
-                        print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
-                        ddata.append([float(0),int(CPS),int(TDC,16),int(ADC,16),int(len(lista)),int(QF)])
-                continue
-            if datastart == dolpos:
-                try:
-                    if debug: print(f'scrivo: [{float(utime)},{int(CPS)},{int(TDC,16)},{int(ADC,16)},{int(0)}]')
-                    ddata.append([float(utime),int(CPS),int(TDC,16),int(ADC,16),int(0),int(QF)])
-                except:
-                    QF = QF +1
-                    print("data is corrupted")
-                    print(f'row is {row}')
-                    print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
-                    ddata.append([float(0),int(CPS),int(TDC,16),int(ADC,16),int(len(lista)),int(QF)])
-            elif datastart == tpos:
-                lista=data.split('t')
-                #if debug: print(f'lista is : {lista}')
-            #'''
-                for i in range(0,len(lista)):
-                  vlista = lista[i].split('v')
-                  if vlista[0]: TDC = vlista[0]
-                  if vlista[1]: ADC = vlista[1]
-                  if int(ADC, 16) > 255:
-                      if int(ADC[2], 16)==1:
-                          print(f"    PROBLEM WITH ADC ???  file: {filename}")
-                          ADC='-4'
-                  #if debug: print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
-                  try:
-                    if debug: print(f'scrivo: [{float(utime)},{int(CPS)},{int(TDC,16)},{int(ADC,16)},{int(len(lista))}]')
-                    ddata.append([float(utime),int(CPS),int(TDC,16),int(ADC,16),int(len(lista)),int(QF)])
-                  except:
-                        QF = QF + 1
-                        print("data is corrupted")
-                        print(f'row is {row}')
-                        print(f'{utime}, {CPS}, {TDC}, {ADC}, {len(lista)}')
-                        ddata.append([float(0),int(CPS),int(TDC,16),int(ADC,16),int(len(lista)),int(QF)])
-            elif datastart == vpos:
-                for i in range(0,len(data)):
-                    vlista = data.split('v')
-                    ## TODO
-            #if debug:
-            #    TheData = pd.DataFrame(ddata, columns=['UNIXTIME', 'CPS', 'TDC', 'ADC', 'nData'])
-            #    return(TheData)
-    TheData = pd.DataFrame(ddata, columns=['UNIXTIME', 'CPS', 'TDC', 'ADC', 'nData', 'QF'])
-    #acqtime = float(TheData.UNIXTIME[len(TheData)-1]) - float(TheData.UNIXTIME[0])
-    try: acqtime = pd.to_datetime(TheData.UNIXTIME[len(TheData)-1], format='%y%m%d%H%M%S.%f') - pd.to_datetime(TheData.UNIXTIME[0], format='%y%m%d%H%M%S.%f')
+    if start is not None or stop is not None:
+        start, stop = _Time_ns(start), _Time_ns(stop)
+        times, offsets = Load_Time_Index(filename, cache=cache, cache_dir=cache_dir)
+        TheData = _Parse_File(filename, *_Byte_Range(times, offsets, start, stop))
+        utime = TheData.UNIXTIME.to_numpy().view(np.int64)
+        keep = utime != np.iinfo(np.int64).min
+        if start is not None: keep &= utime >= start
+        if stop is not None: keep &= utime < stop
+        if not keep.all(): TheData = TheData[keep].reset_index(drop=True)
+        if not len(TheData): return(_Compact(TheData), timedelta(0)) ## nothing in the range
+    elif use_mmap and not debug: TheData = _Parse_File(filename)
+    else:
+        chunks = list(Load_csv_chunks(filename, chunksize=chunksize, debug=debug))
+        if chunks: TheData = pd.concat(chunks, ignore_index=True)
+        else: TheData = _Parse_Records([])
+    TheData = _Compact(TheData)
+    try: acqtime = _Acq_Time(TheData.UNIXTIME)
     except:
         print(f"    ERROR IN ACQ TIME !!! file: {filename}")
         acqtime = -3
-    #TheData.df = TheData.df.concat(ddata, ignore_index=True)
-    #return(TheData)
-            #'''
     return(TheData, acqtime)
 
 def Load_counts(filename=None, debug=False):
@@ -239,64 +755,553 @@ def Load_counts(filename=None, debug=False):
         print("file not .csv, please provide a valid filename")
         return(0)
     ddata = []
-    with open(filename, 'r') as file:
-        #rawdata = csv.reader(file, delimiter=',')
-        for line in file: rawdata = line.split(',')
-        for row in rawdata:
-            dolpos = row.find('$')
-            if (dolpos <=1): continue
-            CPS = row[dolpos+1:]
-            if debug: print(f'row is {row}')
-            data = row[:dolpos-1]
-            if debug: print(f'data is {data}')
-            utime = data[1:19]
-            if debug: print(f'{utime}, {CPS}')
-            TDC = '0'
-            ADC = '0'
-            lista = '0'
-            ddata.append([float(utime),int(CPS),int(TDC,16),int(ADC,16),int(len(lista))])
+    for row in Iter_Records(filename):
+        dolpos = row.find('$')
+        if (dolpos <=1): continue
+        CPS = row[dolpos+1:]
+        if debug: print(f'row is {row}')
+        data = row[:dolpos-1]
+        if debug: print(f'data is {data}')
+        utime = data[1:19]
+        if debug: print(f'{utime}, {CPS}')
+        TDC = '0'
+        ADC = '0'
+        lista = '0'
+        ddata.append([utime,int(CPS),int(TDC,16),int(ADC,16),int(len(lista))])
     TheData = pd.DataFrame(ddata, columns=['UNIXTIME', 'CPS', 'TDC', 'ADC', 'nData'])
-    try: acqtime = pd.to_datetime(TheData.UNIXTIME[len(TheData)-1], format='%y%m%d%H%M%S.%f') - pd.to_datetime(TheData.UNIXTIME[0], format='%y%m%d%H%M%S.%f')
-    except: print("    ERROR IN ACQ TIME !!!")
+    TheData['UNIXTIME'] = _Parse_Time(TheData.UNIXTIME.to_numpy())
+    TheData = _Compact(TheData)
+    try: acqtime = _Acq_Time(TheData.UNIXTIME)
+    except:
+        print(f"    ERROR IN ACQ TIME !!! file: {filename}")
+        acqtime = -3
+    return(TheData, acqtime)
+
+def _Cache_Path(filename, SoloCounts=False, cache_dir=None, kind=None, ext=CACHE_FORMAT):
+    '''
+    SCOPE: name of the cache file of a datafile
+    INPUT: the file name, SoloCounts as in Load_Merge_csv(), the cache folder,
+           kind and extension of the cached object (default parsed data)
+    OUTPUT: the path of the cache file (str)
+    '''
+    directory, name = os.path.split(os.path.abspath(filename))
+    if not cache_dir: cache_dir = os.path.join(directory, CACHE_DIR)
+    if not kind: kind = 'counts' if SoloCounts else 'data'
+    return(os.path.join(cache_dir, f'{name}.{kind}.{ext}'))
+
+def _Write_Replace(filename, write):
+    '''
+    SCOPE: write a file through a temporary one, moved in place only when complete
+    NOTE: a write that is interrupted never leaves a partial file with the final name
+    INPUT: the file name, function(name) writing the file
+    '''
+    temporary = f'{filename}.{os.getpid()}.tmp'
+    try:
+        write(temporary)
+        os.replace(temporary, filename)
+    finally:
+        with contextlib.suppress(FileNotFoundError): os.remove(temporary)
+
+def Load_File(filename=None, SoloCounts=False, cache=True, cache_dir=None, start=None, stop=None):
+    '''
+    SCOPE: load a datafile through Load_csv() or Load_counts(), using a cache of the parsed data
+    NOTE: the parsed DataFrame is stored in a parquet file (if pyarrow is available,
+          a pickle otherwise) and reused while size, modification time of the datafile
+          and PARSER_VERSION do not change, a damaged cache file is parsed again; with start/stop only that
+          time range is parsed (see Load_csv), the cache of the full file is not used;
+          with SoloCounts the counts of the file (cached) are selected by time
+    INPUT: the file name, SoloCounts as in Load_Merge_csv(), use of the cache, the cache folder,
+           start, stop
+    OUTPUT: a Pandas DataFrame, acquisition time
+    '''
+    if start is not None or stop is not None:
+        if not SoloCounts: return(Load_csv(filename, start=start, stop=stop, cache=cache, cache_dir=cache_dir))
+        TheData, acqtime = Load_File(filename, SoloCounts=True, cache=cache, cache_dir=cache_dir)
+        keep = TheData.UNIXTIME.notna()
+        if start is not None: keep &= TheData.UNIXTIME >= pd.Timestamp(start)
+        if stop is not None: keep &= TheData.UNIXTIME < pd.Timestamp(stop)
+        TheData = TheData[keep].reset_index(drop=True)
+        return(TheData, _Acq_Time(TheData.UNIXTIME) if len(TheData) else timedelta(0))
+    Load = Load_counts if SoloCounts else Load_csv
+    if not cache: return(Load(filename))
+    stat = os.stat(filename)
+    key = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'version': PARSER_VERSION}
+    cachefile = _Cache_Path(filename, SoloCounts=SoloCounts, cache_dir=cache_dir)
+    try:
+        with open(cachefile + '.json', 'r') as file: meta = json.load(file)
+    except (OSError, ValueError):
+        meta = {}
+    if {k: meta.get(k) for k in key} == key:
+        try:
+            if CACHE_FORMAT == 'parquet': TheData = pd.read_parquet(cachefile)
+            else: TheData = pd.read_pickle(cachefile)
+            acqtime = -3 if meta.get('acqtime') is None else pd.Timedelta(meta['acqtime'], unit='ns')
+            return(TheData, acqtime)
+        except Exception as error: ## truncated or damaged (e.g. a run killed while writing it)
+            print(f"    cache of file {filename} not readable ({type(error).__name__}), parsed again")
+    TheData, acqtime = Load(filename)
+    try:
+        os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+        with contextlib.suppress(FileNotFoundError): os.remove(cachefile + '.json') ## old key first
+        if CACHE_FORMAT == 'parquet': _Write_Replace(cachefile, TheData.to_parquet)
+        else: _Write_Replace(cachefile, TheData.to_pickle)
+        key['acqtime'] = acqtime.value if isinstance(acqtime, timedelta) else None
+        def Dump(name):
+            with open(name, 'w') as file: json.dump(key, file)
+        _Write_Replace(cachefile + '.json', Dump)
+    except (OSError, ValueError) as error:
+        print(f"    cache not written for file {filename}: {error}")
     return(TheData, acqtime)
 
-def Load_Merge_csv(directory=None, InName=None, OutName=None, debug=False, SoloCounts=False):
+def _Index_Block(buf, base, block, last):
+    '''
+    SCOPE: entries of the time index found in a block of a datafile (see Build_Time_Index)
+    INPUT: NumPy uint8 array with whole records, its offset in the file, block length (ns),
+           number of the block of the last valid time before this one
+    OUTPUT: times (ns) and offsets of the first record of each new block, number of the last block
+    '''
+    cls = BYTE_CLASS[buf]
+    starts = np.concatenate(([0], np.flatnonzero(cls == SEPARATOR) + 1))
+    starts = starts[starts < len(buf)]
+    starts = starts[buf[starts] == ord('u')]
+    if not len(starts): return(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), last)
+    stops = np.flatnonzero((cls != DIGIT) & (cls != DOT))
+    stops = np.append(stops, len(buf))
+    length = stops[np.searchsorted(stops, starts + 1)] - starts - 1
+    times = _Parse_Time(_Bytes_to_text(buf, starts + 1, length)).view(np.int64)
+    valid = times != np.iinfo(np.int64).min ## NaT
+    times, starts = times[valid], starts[valid]
+    number = times // block
+    new = number != np.concatenate(([last], number[:-1]))
+    if len(number): last = int(number[-1])
+    return(times[new], starts[new] + base, last)
+
+def Build_Time_Index(filename, block=TIME_BLOCK):
+    '''
+    SCOPE: byte offset of the first record of each time block of a datafile
+    NOTE: one scan at byte level of the time of the records (u...), without parsing the hits;
+          a new entry starts every time the record time enters another block of block seconds,
+          records without a valid time do not start a block
+    INPUT: the file name, seconds per block
+    OUTPUT: NumPy int64 arrays: times (ns since epoch, first record of each block), byte offsets
+    '''
+    block = int(block * 10**9)
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size: return(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        times, offsets = [], []
+        last = np.iinfo(np.int64).min
+        for start, stop in _Blocks(mm, 0, size):
+            t, o, last = _Index_Block(buf[start:stop], start, block, last)
+            times.append(t)
+            offsets.append(o)
+    finally:
+        buf = None
+        _Close_Map(mm)
+    return(np.concatenate(times), np.concatenate(offsets))
+
+def Save_Time_Index(filename, times, offsets, block=TIME_BLOCK, cache_dir=None):
+    '''
+    SCOPE: write the time index of a datafile in its sidecar (json, in the cache folder)
+    NOTE: the index is valid while size and modification time of the datafile do not change
+    INPUT: the file name, times (ns) and offsets of the blocks, seconds per block, the cache folder
+    OUTPUT: the file name of the sidecar
+    '''
+    stat = os.stat(filename)
+    indexfile = _Cache_Path(filename, cache_dir=cache_dir, kind='timeindex', ext='json')
+    os.makedirs(os.path.dirname(indexfile), exist_ok=True)
+    with open(indexfile, 'w') as file:
+        json.dump({'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'version': PARSER_VERSION, 'block': block,
+                   'times': [int(t) for t in times], 'offsets': [int(o) for o in offsets]}, file)
+    return(indexfile)
+
+def Load_Time_Index(filename, cache=True, cache_dir=None, block=TIME_BLOCK):
+    '''
+    SCOPE: time index of a datafile: from its sidecar if up to date, otherwise built and saved
+    NOTE: the sidecar is written by aq.ArduSiPM_Writer when the file is closed, or here
+          the first time it is needed (one scan of the file)
+    INPUT: the file name, use of the sidecar, the cache folder, seconds per block of a new index
+    OUTPUT: NumPy int64 arrays: times (ns), byte offsets
+    '''
+    if cache:
+        stat = os.stat(filename)
+        key = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'version': PARSER_VERSION}
+        indexfile = _Cache_Path(filename, cache_dir=cache_dir, kind='timeindex', ext='json')
+        try:
+            with open(indexfile, 'r') as file: saved = json.load(file)
+            if {k: saved.get(k) for k in key} == key:
+                return(np.array(saved['times'], dtype=np.int64), np.array(saved['offsets'], dtype=np.int64))
+        except (OSError, ValueError, KeyError):
+            pass
+    times, offsets = Build_Time_Index(filename, block=block)
+    if cache:
+        try: Save_Time_Index(filename, times, offsets, block=block, cache_dir=cache_dir)
+        except OSError as error: print(f"    time index not written for file {filename}: {error}")
+    return(times, offsets)
+
+def Check_Time_Index(filename, cache_dir=None):
+    '''
+    SCOPE: check the time index sidecar of a datafile (e.g. written by aq.ArduSiPM_Writer)
+           against the one built from the file
+    INPUT: the file name, the cache folder
+    OUTPUT: True if they are the same, False if not, None if there is no valid sidecar
+    '''
+    indexfile = _Cache_Path(filename, cache_dir=cache_dir, kind='timeindex', ext='json')
+    try:
+        with open(indexfile, 'r') as file: saved = json.load(file)
+    except (OSError, ValueError):
+        return(None)
+    stat = os.stat(filename)
+    if (saved.get('size'), saved.get('mtime')) != (stat.st_size, stat.st_mtime_ns): return(None)
+    times, offsets = Build_Time_Index(filename, block=saved.get('block', TIME_BLOCK))
+    return(saved['offsets'] == offsets.tolist() and saved['times'] == times.tolist())
+
+def _Byte_Range(times, offsets, start=None, stop=None):
+    '''
+    SCOPE: bytes of a datafile holding the records in [start, stop), from its time index
+    INPUT: times (ns) and offsets of the index, start, stop (ns, None = open)
+    OUTPUT: first and last+1 byte (None = end of file)
+    '''
+    if len(times) and (np.diff(times) <= 0).any(): return(0, None) ## clock jumps: no seek
+    begin, end = 0, None
+    if start is not None:
+        i = np.searchsorted(times, start, side='right') - 1
+        if i >= 0: begin = int(offsets[i])
+    if stop is not None:
+        j = np.searchsorted(times, stop, side='left')
+        if j < len(times): end = int(offsets[j])
+    return(begin, end)
+
+def _Last_Time(filename, tail=1<<16):
+    '''
+    SCOPE: time of the last record of a datafile with a valid time, from its last bytes
+    INPUT: the file name, bytes to look at
+    OUTPUT: the time (ns), None if not found
+    '''
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        begin = max(size - tail, 0)
+        file.seek(begin)
+        data = file.read()
+    if begin: ## start at a record boundary
+        cut = [p for p in (data.find(b'\n'), data.find(b',')) if p >= 0]
+        if not cut: return(None)
+        begin += min(cut) + 1
+    utime = _Parse_File(filename, begin).UNIXTIME.to_numpy().view(np.int64)
+    utime = utime[utime != np.iinfo(np.int64).min]
+    return(int(utime.max()) if len(utime) else None)
+
+def _In_Range(filename, start=None, stop=None, cache=True, cache_dir=None):
+    '''
+    SCOPE: True if a datafile may have records with time in [start, stop)
+    NOTE: first time from the time index, last time from the end of the file (_Last_Time);
+          files without valid times have no records in any range
+    INPUT: the file name, start, stop (ns, None = open), cache options of Load_Time_Index()
+    '''
+    times, offsets = Load_Time_Index(filename, cache=cache, cache_dir=cache_dir)
+    if not len(times): return(False)
+    if stop is not None and times[0] >= stop: return(False)
+    if start is not None:
+        last = _Last_Time(filename)
+        if last is not None and last < start: return(False)
+    return(True)
+
+def _Time_ns(value):
+    return(None if value is None else pd.Timestamp(value).as_unit('ns').value)
+
+def _Compact(TheData):
+    '''
+    SCOPE: downcast the integer columns of a DataFrame to the smallest type holding their values
+    NOTE: signed types (of at least 16 bits, so that max()+1 and similar do not overflow)
+          are kept for the columns with the negative error codes (-3, -4, -5)
+    INPUT: a Pandas DataFrame
+    OUTPUT: the same DataFrame, with compact columns
+    '''
+    for c in TheData.columns:
+        if not np.issubdtype(TheData[c].dtype, np.integer): continue
+        values = TheData[c].to_numpy()
+        low, high = (values.min(), values.max()) if len(values) else (0, 0)
+        types = (np.uint8, np.uint16, np.uint32) if c == 'QF' and low >= 0 else (np.int16, np.int32)
+        for dtype in types:
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                TheData[c] = values.astype(dtype)
+                break
+    return(TheData)
+
+def Memory_Report(TheData, label=None):
+    '''
+    SCOPE: print the memory used by each column of a DataFrame
+    INPUT: a Pandas DataFrame, a label for the printout
+    OUTPUT: Pandas Series column -> bytes (deep, categories and strings included)
+    '''
+    usage = TheData.memory_usage(deep=True, index=True)
+    print(f'memory usage of {label or "data"}: {usage.sum()/2**20:.1f} MB for {len(TheData)} rows')
+    for c, dtype in TheData.dtypes.items():
+        print(f'    {c:<10} {str(dtype):<16} {usage[c]/2**20:10.1f} MB')
+    return(usage)
+
+def Concat_Columns(data, files=None):
+    '''
+    SCOPE: concatenate the data of many files column by column, without intermediate copies
+    NOTE: the input arrays are released (the dicts are emptied) as soon as each column is
+          built, so the peak memory is the result plus one column
+    INPUT: list of dict column -> NumPy array, list of file names (for the FILE column)
+    OUTPUT: a Pandas DataFrame
+    '''
+    lengths = [len(next(iter(d.values()))) if d else 0 for d in data]
+    columns = {}
+    for c in (list(data[0]) if data else []):
+        columns[c] = np.concatenate([d.pop(c) for d in data])
+    if files is not None:
+        columns['FILE'] = pd.Categorical.from_codes(np.repeat(np.arange(len(files), dtype=np.int32), lengths),
+                                                    categories=[os.path.basename(f) for f in files])
+    return(pd.DataFrame(columns, copy=False))
+
+def _Load_File(filename, SoloCounts=False, cache=True, cache_dir=None, start=None, stop=None):
+    '''
+    SCOPE: load a single file in a worker process of Load_Merge_csv()
+    INPUT: the file name, SoloCounts, cache, cache_dir, start, stop as in Load_File()
+    OUTPUT: a dict column -> NumPy array (cheap to send back to the main process), acquisition time
+    '''
+    ldata, time = Load_File(filename, SoloCounts=SoloCounts, cache=cache, cache_dir=cache_dir, start=start, stop=stop)
+    return({c: ldata[c].to_numpy() for c in ldata.columns}, time)
+
+def Load_Merge_csv(directory=None, InName=None, OutName=None, debug=False, SoloCounts=False, workers=None,
+                   cache=True, cache_dir=None, index=None, lowmem=False, start=None, stop=None):
     '''
     SCOPE:
-    INPUT: path to the folder with xlsx data files
+    NOTE: with workers > 1 the files are parsed in parallel by a pool of processes,
+          parsed files are cached as explained in Load_File(),
+          with lowmem the files are merged by Concat_Columns() instead of pd.concat(),
+          the FILE column (categorical) is the name of the source file of each row;
+          with start/stop only the files with records in [start, stop) are loaded (first
+          and last record time, see _In_Range) and only the bytes of that time range are
+          parsed (see Load_csv), e.g. ten minutes of a 24 hours run
+    INPUT: path to the folder with csv data files (or an ArduSiPM_RunIndex of it),
+           number of worker processes, cache options, lowmem, start, stop (datetime or str)
     OUTPUT: a Pandas DataFrame
     '''
     #TODO: return an ArduSiPM_MetaData
-    if not directory:
+    if not directory and not index:
         print('PLEASE, provide a directory to scan... ')
         return(0,0)
+    if not index: index = ArduSiPM_RunIndex(directory)
     nFile = 0
     now = datetime.now()
     totACQTime = now - now
     data = []
-    slash = '/'
     if(InName): print(f"I will skip all files that does NOT contain {InName}")
     if(OutName): print(f"I will skip all files that does contain {OutName}")
-    ## loops on the files of the directory
-    for filename in sorted(os.listdir(directory)): #, key=numericalSort):
-        if filename.endswith(".csv"):
-            if InName and InName not in filename:
-                print("skipping " + filename)
-                continue
-            if '~' in filename: continue
-            if OutName and OutName in filename:
-                print("skipping " + filename)
-                continue
+    files = index.Select(InName=InName, OutName=OutName, start=start, stop=stop, ext='.csv', verbose=debug)
+    if start is not None or stop is not None: ## the modification time is only an upper limit of the run end
+        files = [f for f in files if _In_Range(f, _Time_ns(start), _Time_ns(stop), cache=cache, cache_dir=cache_dir)]
+    # loading and filtering data:
+    if workers and workers > 1 and len(files) > 1:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(files)))
+        nf = len(files)
+        results = ((pd.DataFrame(columns), time) for columns, time in
+                   pool.map(_Load_File, files, [SoloCounts]*nf, [cache]*nf, [cache_dir]*nf, [start]*nf, [stop]*nf))
+    else:
+        pool = None
+        results = (Load_File(filename, SoloCounts=SoloCounts, cache=cache, cache_dir=cache_dir, start=start, stop=stop)
+                   for filename in files)
+    try:
+        for filename, (ldata, time) in zip(files, results):
             nFile = nFile+1
-            # loading and filtering data:
-            print(f'loading file {directory+slash+filename}')
-            #data.append(Load_csv(directory+"/"+filename)) #this is a list of DataFraMe
-            if not (SoloCounts): ldata, time = (Load_csv(directory+"/"+filename))
-            if (SoloCounts): ldata, time = Load_counts(directory+"/"+filename)
-            data.append(ldata) #this is a list of DataFraMe
+            print(f'loading file {filename}')
+            if isinstance(ldata, pd.DataFrame) and lowmem: ldata = {c: ldata[c].to_numpy(copy=True) for c in ldata.columns}
+            elif not isinstance(ldata, pd.DataFrame) and not lowmem: ldata = pd.DataFrame(ldata, copy=False)
+            data.append(ldata) #this is a list of DataFraMe (of dict of arrays if lowmem)
             try: totACQTime = totACQTime + time
-            except: print("    ERROR IN ACQ TIME !!! file: {filename}")
+            except: print(f"    ERROR IN ACQ TIME !!! file: {filename}")
             if debug: print(f'Total acquisition: {totACQTime.total_seconds()} sec. last file time: {time.total_seconds()} sec.')
-    TheData = pd.concat(data, ignore_index=True) #this is a DataFrame
+    finally:
+        if pool: pool.shutdown()
+    if not data:
+        TheData = _Parse_Records([])
+        TheData['FILE'] = pd.Categorical([], categories=[])
+    elif lowmem: TheData = Concat_Columns(data, files=files)
+    else:
+        lengths = [len(ldata) for ldata in data]
+        TheData = pd.concat(data, ignore_index=True) #this is a DataFrame
+        TheData['FILE'] = pd.Categorical.from_codes(np.repeat(np.arange(len(files), dtype=np.int32), lengths),
+                                                    categories=[os.path.basename(f) for f in files])
     print(f'{nFile} files loaded for {totACQTime.total_seconds()} seconds of acquiring time')
+    if debug: Memory_Report(TheData)
     return(TheData, totACQTime)
+
+'''==================
+     Follow files being written
+=================='''
+def _Last_Separator(file, begin, end, block=1<<16):
+    '''
+    SCOPE: end of the last complete record in a byte range of an open datafile
+    NOTE: the range is read backwards in blocks of block bytes, only up to the last separator
+    INPUT: the file (binary), first and last+1 byte, bytes per read
+    OUTPUT: the byte after the last '\n' or ',' (begin if there is none)
+    '''
+    stop = end
+    while stop > begin:
+        start = max(stop - block, begin)
+        file.seek(start)
+        chunk = file.read(stop - start)
+        at = max(chunk.rfind(b'\n'), chunk.rfind(b','))
+        if at >= 0: return(start + at + 1)
+        stop = start
+    return(begin)
+
+class ArduSiPM_Follower:
+    '''
+    SCOPE: incremental loader of runs still being acquired (e.g. by RunIt/aq.Acquire_Stream)
+    NOTE: the last parsed byte of each file is kept, every Update() parses only the complete
+          records appended since then (up to the last '\n' or ','), the partial record at the
+          end of a file waits for the next Update() (or Update(final=True)); in a folder the
+          new files (e.g. rotated by aq.ArduSiPM_Writer) are picked up as they appear.
+          A file that gets shorter (rewritten) is reloaded after dropping its rows and exposure,
+          or skipped with a warning if histos are filled (their entries cannot be removed).
+          New rows go to histos (see a_histo.Default_Histos, exposure from the record times)
+          and, with keep_data, to the dataset returned by Data()
+    INPUT: a csv datafile or a folder of them, filters as in Load_Merge_csv() (folder only),
+           dict of histograms to fill, keep the rows in memory
+    '''
+    def __init__(self, source, InName=None, OutName=None, histos=None, keep_data=True):
+        self.source = source
+        self.InName = InName
+        self.OutName = OutName
+        self.histos = histos
+        self.keep_data = keep_data
+        self.files = []     ## files followed, in order of appearance
+        self.offsets = {}   ## file -> first byte not parsed yet
+        self.last = {}      ## file -> last valid time (ns), for the exposure
+        self.counts = {}    ## file -> [rows, exposure] parsed so far
+        self.skipped = set() ## files rewritten while histos were filled
+        self.chunks = []    ## (number of the file, rows) not yet in self.data
+        self.data = None
+        self.nRows = 0
+        self.exposure = 0.
+
+    def _Files(self):
+        if not os.path.isdir(self.source): return([self.source])
+        names = sorted(entry.name for entry in os.scandir(self.source) if entry.is_file())
+        keep = [n for n in names if n.endswith('.csv') and '~' not in n
+                and (not self.InName or self.InName in n) and not (self.OutName and self.OutName in n)]
+        return([os.path.join(self.source, n) for n in keep])
+
+    def _Drop(self, filename):
+        '''
+        SCOPE: remove what a file rewritten from scratch contributed so far
+        OUTPUT: True if the file can be reloaded from the start
+        '''
+        if self.histos is not None:
+            print(f"    file {filename} is shorter than before, histograms cannot drop its rows: file skipped")
+            self.skipped.add(filename)
+            return(False)
+        print(f"    file {filename} is shorter than before, reloaded from the start")
+        rows, exposure = self.counts.pop(filename, (0, 0.))
+        self.nRows -= rows
+        self.exposure -= exposure
+        self.last.pop(filename, None)
+        number = self.files.index(filename)
+        self.chunks = [(n, ldata) for n, ldata in self.chunks if n != number]
+        if self.data is not None:
+            self.data = self.data[self.data.FILE != os.path.basename(filename)].reset_index(drop=True)
+        return(True)
+
+    def _Read(self, filename, final=False):
+        if filename in self.skipped: return(None)
+        begin = self.offsets.get(filename, 0)
+        with open(filename, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < begin: ## file rewritten from scratch
+                if not self._Drop(filename): return(None)
+                begin = 0
+            if size == begin: return(None)
+            end = size if final else _Last_Separator(file, begin, size)
+        if end <= begin: return(None) ## only a partial record so far
+        self.offsets[filename] = end
+        return(_Parse_File(filename, begin, end))
+
+    def _Exposure(self, filename, ldata):
+        utime = ldata.UNIXTIME.to_numpy().view(np.int64)
+        utime = utime[utime != np.iinfo(np.int64).min]
+        if not len(utime): return(0.)
+        first = self.last.get(filename, utime[0])
+        self.last[filename] = utime[-1]
+        return(max(int(utime[-1] - first), 0) / 1e9)
+
+    def Update(self, final=False):
+        '''
+        SCOPE: parse what was appended to the files since the last call
+        INPUT: final=True parses also the last record of each file without its separator
+               (the acquisition is over)
+        OUTPUT: a Pandas DataFrame with the new rows (FILE column as in Load_Merge_csv)
+        '''
+        new = []
+        for filename in self._Files():
+            if filename not in self.offsets:
+                self.files.append(filename)
+                self.offsets[filename] = 0
+            ldata = self._Read(filename, final=final)
+            if ldata is None or not len(ldata): continue
+            exposure = self._Exposure(filename, ldata)
+            self.exposure += exposure
+            counts = self.counts.setdefault(filename, [0, 0.])
+            counts[0] += len(ldata)
+            counts[1] += exposure
+            if self.histos is not None:
+                import a_histo as ah
+                ah.Fill_Histos(self.histos, ldata, exposure=exposure)
+            self.nRows += len(ldata)
+            number = self.files.index(filename)
+            new.append((number, ldata))
+            if self.keep_data: self.chunks.append((number, ldata))
+        return(self._Frame(new))
+
+    def _Frame(self, chunks):
+        categories = [os.path.basename(f) for f in self.files]
+        if not chunks:
+            TheData = _Parse_Records([])
+            TheData['FILE'] = pd.Categorical([], categories=categories)
+            return(TheData)
+        TheData = _Compact(pd.concat([ldata for number, ldata in chunks], ignore_index=True))
+        codes = np.repeat([number for number, ldata in chunks], [len(ldata) for number, ldata in chunks])
+        TheData['FILE'] = pd.Categorical.from_codes(codes.astype(np.int32), categories=categories)
+        return(TheData)
+
+    def Data(self):
+        '''
+        SCOPE: all the rows parsed so far (keep_data=True)
+        NOTE: the new chunks are appended to the dataset only when it is asked for
+        OUTPUT: a Pandas DataFrame (as Load_Merge_csv), total acquisition time
+        '''
+        if self.chunks:
+            fresh = self._Frame(self.chunks)
+            self.chunks = []
+            if self.data is None: self.data = fresh
+            else: ## files found later are new categories
+                old = self.data.FILE.cat.set_categories(fresh.FILE.cat.categories)
+                self.data = pd.concat([self.data.assign(FILE=old), fresh], ignore_index=True)
+        if self.data is None: self.data = self._Frame([])
+        return(self.data, timedelta(seconds=self.exposure))
+
+    def Follow(self, interval=5., duration=None, callback=None):
+        '''
+        SCOPE: call Update() every interval seconds (until Ctrl-C or for duration seconds)
+        INPUT: seconds between updates, total seconds (None = until Ctrl-C),
+               callback(follower, new rows) called after each update with new rows
+        OUTPUT: the follower
+        '''
+        stopat = None if duration is None else time.monotonic() + duration
+        try:
+            while stopat is None or time.monotonic() < stopat:
+                start = time.monotonic()
+                new = self.Update()
+                if callback and len(new): callback(self, new)
+                time.sleep(max(interval - (time.monotonic() - start), 0))
+        except KeyboardInterrupt:
+            print('follow stopped by user')
+        print(f'{self.nRows} rows from {len(self.files)} files, {self.exposure:.1f} seconds of acquiring time')
+        return(self)
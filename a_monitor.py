@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  live monitor                 |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, rolling statistics and blitting monitor     |
+ --------------------------------------------------------------------
+'''
+
+import time
+from collections import deque
+from queue import Queue, Empty, Full
+import numpy as np
+import a_load as lf
+import a_histo as ah
+
+'''==================
+  Rolling statistics
+=================='''
+class Rolling_Stats:
+    '''
+    SCOPE: mean, variance and max of the last values of a stream, updated in O(1)
+    NOTE: running sums for mean/variance, a monotonic deque for the max
+          (amortized O(1) per value, nothing is recomputed over the window)
+    INPUT: number of values in the window
+    '''
+    def __init__(self, window=60):
+        self.window = window
+        self.values = deque()
+        self.maxima = deque() ## decreasing values, the first one is the max of the window
+        self.sum = 0
+        self.sum2 = 0
+
+    def Push(self, x):
+        self.values.append(x)
+        self.sum += x
+        self.sum2 += x*x
+        while self.maxima and self.maxima[-1] < x: self.maxima.pop()
+        self.maxima.append(x)
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            self.sum -= old
+            self.sum2 -= old*old
+            if self.maxima[0] == old: self.maxima.popleft()
+
+    def __len__(self):
+        return(len(self.values))
+
+    def Mean(self):
+        if not self.values: return(0.)
+        return(self.sum / len(self.values))
+
+    def Var(self):
+        if not self.values: return(0.)
+        return(max(self.sum2 / len(self.values) - self.Mean()**2, 0.))
+
+    def Max(self):
+        if not self.maxima: return(0)
+        return(self.maxima[0])
+
+'''==================
+     Live monitor
+=================='''
+class ArduSiPM_Monitor:
+    '''
+    SCOPE: live view of an acquisition: CPS of the last seconds, ADC and TDC spectra
+    NOTE: the acquisition threads only call Put(), that never blocks (records are dropped,
+          and counted in nDropped, if the monitor is late); the plot is refreshed in the
+          main thread at most once every refresh seconds, moving the artists in place
+          (blitting), the full figure is redrawn only when the axes must be rescaled
+    INPUT: number of records of the rolling CPS window, refresh time in seconds,
+           size of the queue, title of the figure
+    '''
+    def __init__(self, window=60, refresh=1., queue_size=10000, title='ArduSiPM live'):
+        self.records = Queue(maxsize=queue_size)
+        self.stats = Rolling_Stats(window)
+        self.histos = {'ADC': ah.ArduSiPM_Histo('ADC', np.arange(ah.ADC_RANGE[0], ah.ADC_RANGE[1]+1) - 0.5),
+                       'TDC': ah.ArduSiPM_Histo('TDC', np.arange(ah.TDC_RANGE[0], ah.TDC_RANGE[1]+1) - 0.5)}
+        self.refresh = refresh
+        self.title = title
+        self.nRecords = 0
+        self.nDropped = 0
+        self.fig = None
+
+    def Put(self, tdata):
+        '''
+        SCOPE: hand a record (as written in the datafile) to the monitor, from any thread
+        '''
+        try: self.records.put_nowait(tdata)
+        except Full: self.nDropped += 1
+
+    def Update(self):
+        '''
+        SCOPE: move the queued records into the rolling statistics and the histograms
+        OUTPUT: number of records used
+        '''
+        batch = []
+        try:
+            while True: batch.append(self.records.get_nowait())
+        except Empty:
+            pass
+        if not batch: return(0)
+        for tdata in batch:
+            try: self.stats.Push(int(tdata[tdata.rindex('$')+1:]))
+            except ValueError: continue
+        hits = lf.HIT.findall('\n'.join(batch))
+        if hits:
+            TDC, ADC = zip(*hits)
+            self.histos['TDC'].Fill(lf._Hex_to_int(TDC))
+            self.histos['ADC'].Fill(lf._Hex_to_int(ADC))
+        self.nRecords += len(batch)
+        return(len(batch))
+
+    def _Setup(self):
+        import matplotlib.pyplot as plt
+        self.fig, (self.axCPS, self.axADC, self.axTDC) = plt.subplots(3, 1, figsize=[8.27,11.69], num=self.title)
+        self.axCPS.set_xlabel('record')
+        self.axCPS.set_ylabel('CPS')
+        self.axCPS.set_xlim(0, self.stats.window)
+        self.axCPS.set_ylim(0, 10)
+        self.line, = self.axCPS.plot([], [], animated=True)
+        self.text = self.axCPS.text(0.01, 0.95, '', transform=self.axCPS.transAxes, va='top', animated=True)
+        self.steps = {}
+        for name, ax in (('ADC', self.axADC), ('TDC', self.axTDC)):
+            histo = self.histos[name]
+            ax.set_xlabel(f'{name} channel')
+            ax.set_xlim(histo.Edges[0], histo.Edges[-1])
+            ax.set_ylim(0, 10)
+            self.steps[name] = ax.stairs(histo.Counts, histo.Edges, animated=True)
+        self.fig.tight_layout()
+        self.fig.canvas.mpl_connect('draw_event', self._Background)
+        plt.show(block=False)
+        self.fig.canvas.draw()
+
+    def _Background(self, event=None):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._Artists()
+
+    def _Artists(self):
+        for artist in (self.line, self.text, *self.steps.values()): self.fig.draw_artist(artist)
+
+    def Draw(self):
+        '''
+        SCOPE: refresh the plot with the current statistics and histograms
+        '''
+        if self.fig is None: self._Setup()
+        rescale = False
+        values = np.fromiter(self.stats.values, dtype=float, count=len(self.stats))
+        self.line.set_data(np.arange(len(values)), values)
+        if self.stats.Max() > self.axCPS.get_ylim()[1]:
+            self.axCPS.set_ylim(0, 2*self.stats.Max())
+            rescale = True
+        self.text.set_text(f'CPS mean {self.stats.Mean():.1f}  std {np.sqrt(self.stats.Var()):.1f}  '
+                           f'max {self.stats.Max()}  records {self.nRecords}  dropped {self.nDropped}')
+        for name, ax in (('ADC', self.axADC), ('TDC', self.axTDC)):
+            counts = self.histos[name].Counts
+            self.steps[name].set_data(counts)
+            if counts.max() > ax.get_ylim()[1]:
+                ax.set_ylim(0, 2*counts.max())
+                rescale = True
+        canvas = self.fig.canvas
+        if rescale: canvas.draw() ## new background, see _Background()
+        else:
+            canvas.restore_region(self.background)
+            self._Artists()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def Run(self, stop):
+        '''
+        SCOPE: refresh loop, in the main thread, until stop() is True
+        INPUT: a function without arguments
+        '''
+        while not stop():
+            start = time.monotonic()
+            self.Update()
+            self.Draw()
+            wait = self.refresh - (time.monotonic() - start)
+            if wait > 0: self.fig.canvas.start_event_loop(wait)
+        self.Update()
+        self.Draw()
+
+    def Report(self):
+        print(f'monitor: {self.nRecords} records, CPS mean {self.stats.Mean():.2f} '
+              f'std {np.sqrt(self.stats.Var()):.2f} max {self.stats.Max()} (last {len(self.stats)} records)')
+        if self.nDropped: print(f'    {self.nDropped} records not shown: the monitor could not keep up')
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  multi-detector acquisition   |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, asyncio engine for many ArduSiPM at once    |
+ --------------------------------------------------------------------
+'''
+
+import os
+import asyncio
+import threading
+from queue import Queue, Full
+from concurrent.futures import ThreadPoolExecutor
+
+import a_acquire as aq
+
+'''==================
+     Multi-detector acquisition
+=================='''
+def Port_Label(port):
+    '''
+    SCOPE: default label of a device: the serial port name without its folder (ttyACM0, COM3),
+           for virtual ports the replayed file name or the scheme, without the options
+    INPUT: the port name (see aq.Open_Port)
+    OUTPUT: the label (str)
+    '''
+    scheme, sep, rest = port.partition('://')
+    if not sep: return(os.path.basename(port))
+    path = rest.partition('?')[0]
+    return(os.path.splitext(os.path.basename(path))[0] or scheme)
+
+class ArduSiPM_Device:
+    '''
+    SCOPE: one ArduSiPM of a multi-detector acquisition
+    INPUT: serial port name, label (used in the file names, default from the port name)
+    '''
+    def __init__(self, port, label=None):
+        self.port = port
+        self.label = label or Port_Label(port)
+        self.ser = None
+        self.reader = None
+        self.writer = None
+        self.queue = None
+        self.nLost = 0
+
+class ArduSiPM_MultiAcquisition:
+    '''
+    SCOPE: acquire from many ArduSiPM in parallel, each one on its own datafiles
+    NOTE: the serial ports are opened and read concurrently (blocking calls run in
+          a thread each), all the records are timestamped by the same aq.Shared_Clock;
+          files are <%y%m%d%H%M%S>_<file_par>_<label>.csv, written by aq.ArduSiPM_Writer.
+          The coroutines Open/Start/Stop/Close/Run are for asyncio code, from the
+          interactive shell use Start_Background() / Stop_Background()
+    INPUT: ports (default: all the ArduSiPM found), labels, label of the files, folder,
+           setup = function(ser) called for each device after opening (thresholds, mode, ...),
+           writer settings as in aq.Acquire_Stream()
+    '''
+    def __init__(self, ports=None, labels=None, file_par='RawData', directory='.', baudrate=115200,
+                 setup=None, queue_size=100000, flush_every=5., max_bytes=None, max_seconds=None, debug=False):
+        if ports is None: ports = aq.Find_ASPM_Ports(debug=debug)
+        if not labels: labels = [None]*len(ports)
+        self.devices = [ArduSiPM_Device(port, label) for port, label in zip(ports, labels)]
+        for device in self.devices: ## e.g. many virtual://, the file names must differ
+            same = [d for d in self.devices if d.label == device.label]
+            if len(same) > 1:
+                for number, d in enumerate(same): d.label = f'{d.label}{number}'
+        self.file_par = file_par
+        self.directory = directory
+        self.baudrate = baudrate
+        self.setup = setup
+        self.queue_size = queue_size
+        self.writer_options = dict(flush_every=flush_every, max_bytes=max_bytes, max_seconds=max_seconds)
+        self.debug = debug
+        self.clock = None
+        self.tasks = []
+        self.running = False
+        self.executor = None
+        self.loop = None
+        self.thread = None
+        print(f'{len(self.devices)} ArduSiPM: {[d.port for d in self.devices]}')
+
+    def _Open_Device(self, device):
+        device.ser = aq.Open_Port(device.port, baudrate=self.baudrate) ## serial or virtual (see aq.Open_Port)
+        if self.setup: self.setup(device.ser)
+
+    async def Open(self):
+        '''
+        SCOPE: open (and setup) all the devices concurrently
+        '''
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.devices), 1))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, self._Open_Device, d) for d in self.devices])
+
+    async def _Acquire(self, device):
+        loop = asyncio.get_running_loop()
+        device.reader = aq.ArduSiPM_LineReader(device.ser, clock=self.clock)
+        try:
+            while self.running:
+                for arrival, line in await loop.run_in_executor(self.executor, device.reader.Read):
+                    tdata = aq.Format_Record(arrival, line)
+                    if(self.debug): print(device.label, tdata)
+                    try: device.queue.put_nowait(tdata)
+                    except Full: device.nLost += 1
+        finally:
+            device.reader.Close()
+            while device.writer.is_alive(): ## tells the writer that the stream is over, without blocking the loop
+                try:
+                    device.queue.put_nowait(None)
+                    break
+                except Full:
+                    await asyncio.sleep(0.05)
+
+    async def Start(self):
+        '''
+        SCOPE: start the acquisition on all the devices, with a common clock
+        '''
+        if self.executor is None: await self.Open()
+        self.clock = aq.Shared_Clock()
+        self.running = True
+        for device in self.devices:
+            device.queue = Queue(maxsize=self.queue_size)
+            device.writer = aq.ArduSiPM_Writer(device.queue, file_par=f'{self.file_par}_{device.label}',
+                                               directory=self.directory, **self.writer_options)
+            device.writer.start()
+        self.tasks = [asyncio.ensure_future(self._Acquire(d)) for d in self.devices]
+        print(f'Acquiring now from {len(self.devices)} devices, started at {self.clock.wall}')
+
+    async def Stop(self):
+        '''
+        SCOPE: stop the acquisition on all the devices, wait for the files to be closed
+        OUTPUT: dict label -> list of files written
+        '''
+        self.running = False
+        await asyncio.gather(*self.tasks)
+        loop = asyncio.get_running_loop()
+        files = {}
+        for device in self.devices:
+            await loop.run_in_executor(None, device.writer.join)
+            device.reader.Report()
+            if device.nLost: print(f'    {device.label}: {device.nLost} records lost')
+            files[device.label] = device.writer.files
+        self.tasks = []
+        return(files)
+
+    async def Close(self):
+        '''
+        SCOPE: close all the serial ports
+        '''
+        for device in self.devices:
+            if device.ser: device.ser.close()
+        if self.executor: self.executor.shutdown()
+        self.executor = None
+
+    async def Run(self, duration_acq):
+        '''
+        SCOPE: open, acquire for duration_acq seconds, stop and close
+        OUTPUT: dict label -> list of files written
+        '''
+        await self.Open()
+        try:
+            await self.Start()
+            await asyncio.sleep(duration_acq)
+            return(await self.Stop())
+        finally:
+            await self.Close()
+
+    def Start_Background(self):
+        '''
+        SCOPE: start the acquisition with the event loop in a background thread (returns immediately)
+        '''
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.Start(), self.loop).result()
+
+    def Stop_Background(self):
+        '''
+        SCOPE: stop an acquisition started with Start_Background()
+        OUTPUT: dict label -> list of files written
+        '''
+        files = asyncio.run_coroutine_threadsafe(self.Stop(), self.loop).result()
+        asyncio.run_coroutine_threadsafe(self.Close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        return(files)
+
+def Run_Multi(duration_acq, ports=None, labels=None, file_par='RawData', **options):
+    '''
+    SCOPE: acquire from all the ArduSiPM (or the given ports) for a given time
+    INPUT: duration in seconds, ports, labels, label of the files, options of ArduSiPM_MultiAcquisition
+    OUTPUT: dict label -> list of files written
+    '''
+    acquisition = ArduSiPM_MultiAcquisition(ports=ports, labels=labels, file_par=file_par, **options)
+    return(asyncio.run(acquisition.Run(duration_acq)))
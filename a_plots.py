@@ -12,17 +12,20 @@
  --------------------------------------------------------------------
 '''
 
+import numpy as np
 import matplotlib.pyplot as plt
 import Utility as ut
+import a_histo as ah
 
 
 '''==================
      Plotting
 =================='''
 #def Plot_ADC(dati, binsize=16, hRange=[0,4095], label='no_label', weights=None, log=True, ylabel=None, fig=1):
-def Plot_ADC(dati, binsize=1, hRange=[0,1000], label='no_label', weights=None, log=True, ylabel=None, fig=1):
+def Plot_ADC(dati, binsize=1, hRange=[0,1000], label='no_label', weights=None, log=True, ylabel=None, fig=1, scale=None):
     '''
     SCOPE: fast plot of ADC spectra
+    NOTE: scale multiplies the counts (e.g. 1/acquisition time for a rate), weights is still accepted
     INPUT: data
     OUTPUT: print info on screen and histo parameters
     '''
@@ -30,10 +33,12 @@ def Plot_ADC(dati, binsize=1, hRange=[0,1000], label='no_label', weights=None, l
     title = 'ADC spectra'
     xlabel = 'ADC channel'
     ylabel = ylabel
-    n, bins, patches = ut.Plot1D(dati.ADC, nBin=nBin, R=hRange, title=title, xlabel=xlabel, label=label, log=log, weights=weights, c=fig)
+    n, bins = ah.Histo1D(dati.ADC.to_numpy(), nBin=nBin, R=hRange, weights=weights)
+    if scale is not None: n = n * scale
+    n, bins, patches = ut.Draw1D(n, bins, title=title, xlabel=xlabel, label=label, log=log, c=fig)
     return n, bins, patches
 
-def Plot_CPS(dati, binsize=1, hRange=[0,100], label='no_label', weights=None, log=True, ylabel=None, fig=1):
+def Plot_CPS(dati, binsize=1, hRange=[0,100], label='no_label', weights=None, log=True, ylabel=None, fig=1, scale=None):
     '''
     SCOPE: fast plot of ADC spectra
     INPUT: data
@@ -43,6 +48,24 @@ def Plot_CPS(dati, binsize=1, hRange=[0,100], label='no_label', weights=None, lo
     title = 'CPS distribution'
     xlabel = 'CPS'
     ylabel = ylabel
-    n, bins, patches = ut.Plot1D(dati.CPS, nBin=nBin, R=hRange, title=title, xlabel=xlabel, label=label, log=log, weights=weights, c=fig)
+    n, bins = ah.Histo1D(dati.CPS.to_numpy(), nBin=nBin, R=hRange, weights=weights)
+    if scale is not None: n = n * scale
+    n, bins, patches = ut.Draw1D(n, bins, title=title, xlabel=xlabel, label=label, log=log, c=fig)
     print(f'CPS mean of {label} is {dati.CPS.mean()}')
     return n, bins, patches
+
+def Plot_Histo(histo, label='no_label', rate=True, log=True, xlim=None, fig=1):
+    '''
+    SCOPE: plot of an a_histo.ArduSiPM_Histo (1D), e.g. a campaign spectrum
+    INPUT: the histogram, rate (counts/sec) or counts, x range to show
+    OUTPUT: histo parameters
+    '''
+    n = histo.Rate() if rate else histo.Counts
+    bins = histo.Edges
+    if xlim:
+        keep = (bins[:-1] >= xlim[0]) & (bins[1:] <= xlim[1])
+        n, bins = n[keep], bins[np.append(keep, False) | np.insert(keep, 0, False)]
+    title = f'{histo.Name} spectra'
+    n, bins, patches = ut.Draw1D(n, bins, title=title, xlabel=histo.Name, label=label, log=log, c=fig)
+    if rate: plt.ylabel('rate (counts/sec)')
+    return n, bins, patches
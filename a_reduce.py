@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  batch reduction              |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, load/quality/histograms/export pipeline     |
+ --------------------------------------------------------------------
+'''
+
+import os
+import sys
+import json
+import contextlib
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import a_load as lf
+import a_histo as ah
+import a_analysis as an
+
+'''==================
+     Reduction
+=================='''
+def _Log_To_Stderr():
+    sys.stdout = sys.stderr
+
+def Reduce_File(filename, cache=True, cache_dir=None):
+    '''
+    SCOPE: reduce one datafile: load (cached), quality flag, histograms
+    NOTE: runs in the worker processes of Reduce(), nothing is plotted
+    INPUT: the file name, cache options as in lf.Load_File()
+    OUTPUT: dict with the summary of the file, dict name -> ah.ArduSiPM_Histo
+    '''
+    data, acqtime = lf.Load_File(filename, cache=cache, cache_dir=cache_dir)
+    exposure = acqtime.total_seconds() if isinstance(acqtime, timedelta) else 0.
+    an.Flag_Quality(data)
+    histos = ah.Fill_Histos(ah.Default_Histos(), data, exposure=exposure)
+    stats = an.Quality_Stats(data)
+    QF = data.QF.value_counts().sort_index()
+    first = an.Record_Starts(data)
+    CPS = data.CPS.to_numpy()[first]
+    CPS = CPS[CPS >= 0] ## no error codes
+    records = int(first.sum())
+    summary = {'file': os.path.basename(filename),
+               'rows': int(len(data)),
+               'records': records,
+               'exposure': exposure,
+               'record_rate': records/exposure if exposure > 0 else None,
+               'cps_mean': float(CPS.mean()) if len(CPS) else None,
+               'corrupted': int(stats.corrupted.sum()),
+               'QF': {str(k): int(v) for k, v in QF.items()}}
+    return(summary, histos)
+
+def Spectra_Table(histos):
+    '''
+    SCOPE: histograms as a long table, one row per bin
+    NOTE: all the bins of 1D histograms, only the filled bins of 2D histograms (Y is NaN for 1D)
+    INPUT: dict name -> ah.ArduSiPM_Histo
+    OUTPUT: a Pandas DataFrame with HISTO, X, Y (bin centers), COUNTS, RATE
+    '''
+    tables = []
+    for name, histo in histos.items():
+        x = (histo.Edges[:-1] + histo.Edges[1:]) / 2
+        rate = histo.Rate()
+        if histo.YEdges is None:
+            tables.append(pd.DataFrame({'HISTO': name, 'X': x, 'Y': np.nan, 'COUNTS': histo.Counts, 'RATE': rate}))
+            continue
+        y = (histo.YEdges[:-1] + histo.YEdges[1:]) / 2
+        ix, iy = np.nonzero(histo.Counts)
+        tables.append(pd.DataFrame({'HISTO': name, 'X': x[ix], 'Y': y[iy],
+                                    'COUNTS': histo.Counts[ix, iy], 'RATE': rate[ix, iy]}))
+    table = pd.concat(tables, ignore_index=True)
+    table['HISTO'] = table.HISTO.astype('category')
+    return(table)
+
+def Export(table, filename):
+    '''
+    SCOPE: write the spectra table, format from the extension (.parquet, .csv, .pkl)
+    OUTPUT: the file name
+    '''
+    if filename.endswith('.parquet'): table.to_parquet(filename)
+    elif filename.endswith('.csv'): table.to_csv(filename, index=False)
+    elif filename.endswith('.pkl'): table.to_pickle(filename)
+    else: raise ValueError(f'unknown output format: {filename} (use .parquet, .csv or .pkl)')
+    return(filename)
+
+def Reduce(directory=None, InName=None, OutName=None, out=None, summary=None, workers=None,
+           cache=True, cache_dir=None, index=None, stderr=False):
+    '''
+    SCOPE: load -> quality flag -> histograms -> export of all the selected files of a folder
+    NOTE: files are selected as in lf.Load_Merge_csv() and reduced in parallel by
+          workers processes (default: number of CPU); only the histograms are merged,
+          memory does not grow with the number of files
+    INPUT: path to the folder with csv data files (or an ArduSiPM_RunIndex of it), filters,
+           output file of the spectra (see Export()), output file of the summary (json),
+           number of worker processes, cache options, stderr=True sends all the messages
+           to stderr (stdout is left for the summary)
+    OUTPUT: dict with the summary (totals and one entry per file), dict name -> ah.ArduSiPM_Histo
+    '''
+    if not index: index = lf.ArduSiPM_RunIndex(directory)
+    if workers is None: workers = os.cpu_count() or 1
+    with contextlib.redirect_stdout(sys.stderr if stderr else sys.stdout):
+        files = index.Select(InName=InName, OutName=OutName, ext='.csv')
+        if workers > 1 and len(files) > 1:
+            nf = len(files)
+            with ProcessPoolExecutor(max_workers=min(workers, nf), initializer=_Log_To_Stderr if stderr else None) as pool:
+                results = list(pool.map(Reduce_File, files, [cache]*nf, [cache_dir]*nf))
+        else:
+            results = [Reduce_File(filename, cache=cache, cache_dir=cache_dir) for filename in files]
+    histos = ah.Merge_Histos([h for s, h in results])
+    per_file = [s for s, h in results]
+    exposure = sum(s['exposure'] for s in per_file)
+    rows = sum(s['rows'] for s in per_file)
+    records = sum(s['records'] for s in per_file)
+    QF = {}
+    for s in per_file:
+        for k, v in s['QF'].items(): QF[k] = QF.get(k, 0) + v
+    result = {'directory': index.Directory, 'InName': InName, 'OutName': OutName,
+              'files': len(files), 'rows': rows, 'records': records, 'exposure': exposure,
+              'record_rate': records/exposure if exposure > 0 else None,
+              'adc_rate': histos['ADC'].Entries/exposure if exposure > 0 else None,
+              'corrupted': sum(s['corrupted'] for s in per_file),
+              'QF': dict(sorted(QF.items(), key=lambda item: int(item[0]))),
+              'out': out, 'per_file': per_file}
+    if out: Export(Spectra_Table(histos), out)
+    if summary:
+        with open(summary, 'w') as file: json.dump(result, file, indent=1)
+    return(result, histos)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  synthetic data               |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, synthetic ArduSiPM streams for benchmarks   |
+ --------------------------------------------------------------------
+'''
+
+import os
+from datetime import datetime, timedelta
+import numpy as np
+
+LAYOUTS = ('new', 'old', 'legacy')
+
+'''==================
+     Synthetic data
+=================='''
+def Synth_Records(n=1000, cps=10., max_hits=None, corrupt=0., adc_scale=80., start=None, period=1.,
+                  layout='new', counts_only=False, seed=None):
+    '''
+    SCOPE: synthetic ArduSiPM records, as sent by the firmware and saved by Save_Data()
+    NOTE: u<%y%m%d%H%M%S.%f>[t<TDC>v<ADC>]...$<CPS>, one record every period seconds;
+          CPS is Poisson(cps), the hits of a record are at most max_hits (data lost at
+          high rate, nData < CPS); corrupt is the fraction of damaged records (missing 'v',
+          'v' before 't', truncated record, garbage); layout='old' adds the extra character
+          before '$' of the firmware < 2.6, counts_only gives records without hits ('$' mode)
+    INPUT: number of records, mean CPS, max hits per record, corrupted fraction, mean ADC,
+           time of the first record, seconds between records, layout, counts only, random seed
+    OUTPUT: list of records (str)
+    '''
+    rng = np.random.default_rng(seed)
+    if start is None: start = datetime(2026, 10, 18)
+    CPS = rng.poisson(cps, n)
+    nHit = np.zeros(n, dtype=np.int64) if counts_only else CPS.copy()
+    if max_hits is not None: nHit = np.minimum(nHit, max_hits)
+    total = int(nHit.sum())
+    TDC = rng.integers(0, 0x1000, total)
+    ADC = np.minimum(rng.exponential(adc_scale, total).astype(np.int64), 0xfff)
+    hexTDC = np.char.mod('%x', TDC) if total else np.zeros(0, dtype=str)
+    hexADC = np.char.mod('%x', ADC) if total else np.zeros(0, dtype=str)
+    jitter = rng.integers(0, 1000000, n)
+    bad = rng.random(n) < corrupt
+    kind = rng.integers(0, 4, n)
+    tail = '0' if layout == 'old' else ''
+    records = []
+    hit = 0
+    for i in range(n):
+        time = start + timedelta(seconds=i*period, microseconds=int(jitter[i]))
+        hits = ''.join(f't{hexTDC[j]}v{hexADC[j]}' for j in range(hit, hit+nHit[i]))
+        hit += nHit[i]
+        record = f"u{time.strftime('%y%m%d%H%M%S.%f')}{hits}{tail}${CPS[i]}"
+        if bad[i]:
+            if kind[i] == 0 and hits: record = record.replace('v', '', 1)
+            elif kind[i] == 1 and hits: record = record.replace('t', 'v', 1)
+            elif kind[i] == 2: record = record[:len(record)//2]
+            else: record = 'garbage' + record[len(record)//2:]
+        records.append(record)
+    return(records)
+
+def Synth_Lines(n=1000, cps=10., max_hits=None, adc_scale=80., rng=None):
+    '''
+    SCOPE: synthetic lines as sent by ArduSiPM in '@' mode (no arrival time): [t<TDC>v<ADC>]...$<CPS>
+    NOTE: used by the virtual device of a_virtual; CPS and hits as in Synth_Records()
+    INPUT: number of lines, mean CPS, max hits per line, mean ADC, a np.random.Generator (or seed)
+    OUTPUT: list of lines (str)
+    '''
+    rng = np.random.default_rng(rng)
+    CPS = rng.poisson(cps, n)
+    nHit = CPS if max_hits is None else np.minimum(CPS, max_hits)
+    total = int(nHit.sum())
+    hits = [f't{t:x}v{a:x}' for t, a in zip(rng.integers(0, 0x1000, total).tolist(),
+                                            np.minimum(rng.exponential(adc_scale, total).astype(np.int64), 0xfff).tolist())]
+    bounds = np.concatenate(([0], np.cumsum(nHit))).tolist()
+    return([''.join(hits[bounds[i]:bounds[i+1]]) + f'${CPS[i]}' for i in range(n)])
+
+def Synth_File(filename, n=1000, layout='new', header=None, **options):
+    '''
+    SCOPE: write a synthetic datafile
+    NOTE: layout='legacy' writes all the records on one line separated by ',' (old Save_Data()),
+          the other layouts one record per line; options as in Synth_Records()
+    INPUT: file name, number of records, layout, header line (starting with '#')
+    OUTPUT: the file size in bytes
+    '''
+    if layout not in LAYOUTS: raise ValueError(f'layout must be one of {LAYOUTS}')
+    records = Synth_Records(n, layout=layout, **options)
+    with open(filename, 'w') as file:
+        if header: file.write(header + '\n')
+        if layout == 'legacy': file.write(','.join(records) + ',')
+        else: file.write('\n'.join(records) + '\n')
+    return(os.path.getsize(filename))
+
+def Synth_Campaign(directory, nFiles=4, n=1000, label='bg', start=None, period=1., seed=None, **options):
+    '''
+    SCOPE: a folder of synthetic runs named as RunIt does (<%y%m%d%H%M%S>_<label>.csv)
+    INPUT: folder, number of files, records per file, label, start, period, seed, options of Synth_File()
+    OUTPUT: list of the files written
+    '''
+    os.makedirs(directory, exist_ok=True)
+    if start is None: start = datetime(2026, 10, 18)
+    files = []
+    for i in range(nFiles):
+        begin = start + timedelta(seconds=i*n*period)
+        filename = os.path.join(directory, f"{begin.strftime('%y%m%d%H%M%S')}_{label}.csv")
+        Synth_File(filename, n=n, start=begin, period=period, seed=None if seed is None else seed+i, **options)
+        files.append(filename)
+    return(files)
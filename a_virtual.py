@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+'''
+ --------------------------------------------------------------------
+|              aaa - ArduSiPM Acquisition & Analysis                 |
+ --------------------------------------------------------------------
+| Python libraries for the ArduSiPM  =  virtual device               |
+| project web: https://sites.google.com/view/particle-detectors/home |
+| code repository: https://github.com/fmessi/aaa.git                 |
+|                                                                    |
+| history:                                                           |
+| 261018 - file created, virtual ArduSiPM (synthetic or replayed)    |
+ --------------------------------------------------------------------
+'''
+
+import os
+import re
+import time
+import threading
+from datetime import datetime
+from urllib.parse import parse_qsl
+import numpy as np
+import a_synth as sy
+
+INFO = {'F': '@FW2.7-virtual', 'S': '@SN0000', 'H': '@HV0', 'I': '@IDvirtual'} ## answers to F, S, H, I
+MENU_PAGE = ('ArduSiPM virtual menu\r\n t threshold\r\n e exit\r\n')
+TDC_FIELD = re.compile(r't[0-9a-fA-F]*')
+HIT_FIELD = re.compile(r'[tv][0-9a-fA-F]*')
+TIME_FIELD = re.compile(r'^u([0-9.]+)')
+
+'''==================
+     Line sources
+=================='''
+def Synthetic_Source(cps=10., max_hits=None, adc_scale=80., threshold_scale=None, seed=None):
+    '''
+    SCOPE: endless synthetic lines for the virtual device (see sy.Synth_Lines)
+    NOTE: with threshold_scale the mean CPS is cps*exp(-threshold/threshold_scale),
+          so a threshold scan gives decreasing rates; lines are made about one second
+          (at most 100 lines) ahead, and made again as soon as threshold or rate change
+    OUTPUT: a function (device) -> (None, line): None = send at the line rate of the device
+    '''
+    rng = np.random.default_rng(seed)
+    lines = []
+    state = {'setting': None}
+    def Next(device):
+        setting = (device.threshold, device.rate)
+        if setting != state['setting']: ## lines made for the old setting are dropped
+            lines.clear()
+            state['setting'] = setting
+        if not lines:
+            mean = cps if not threshold_scale else cps*np.exp(-device.threshold/threshold_scale)
+            n = int(min(max(device.rate or 100, 1), 100))
+            lines.extend(reversed(sy.Synth_Lines(n, cps=mean, max_hits=max_hits, adc_scale=adc_scale, rng=rng)))
+        return(None, lines.pop())
+    return(Next)
+
+def Replay_Source(filename, speed=1., loop=False):
+    '''
+    SCOPE: lines of a run file, sent with the recorded timing
+    NOTE: the arrival times (u...) of the records are removed, each line is sent at
+          (record time - first record time)/speed; speed=None sends at the line rate
+          of the device; records without a valid time are sent right after the previous one
+    INPUT: a datafile (lf.Load_csv format), speed factor (N x real time), start again at the end
+    OUTPUT: a function (device) -> (seconds from the start, line), (None, None) at the end
+    '''
+    import a_load as lf
+    state = {'records': lf.Iter_Records(filename), 'first': None, 'last': 0., 'offset': 0.}
+    def Next(device):
+        for record in state['records']:
+            match = TIME_FIELD.match(record)
+            line = record[match.end():] if match else record
+            if speed is None: return(None, line)
+            try: when = datetime.strptime(match.group(1), '%y%m%d%H%M%S.%f').timestamp()
+            except (AttributeError, ValueError): return(state['last'], line)
+            if state['first'] is None: state['first'] = when
+            state['last'] = state['offset'] + (when - state['first'])/speed
+            return(state['last'], line)
+        if not loop: return(None, None)
+        state.update(records=lf.Iter_Records(filename), first=None, offset=state['last'])
+        return(Next(device))
+    return(Next)
+
+def Apply_Mode(line, mode):
+    '''
+    SCOPE: data sent in each mode: '@' TDC+ADC+CPS, '#' ADC+CPS, '$' counts only
+    '''
+    if mode == '$': return(HIT_FIELD.sub('', line))
+    if mode == '#': return(TDC_FIELD.sub('', line))
+    return(line)
+
+'''==================
+     Virtual device
+=================='''
+class ArduSiPM_Virtual:
+    '''
+    SCOPE: in-process ArduSiPM with the interface of serial.Serial used by aaa
+           (read, readline, write, in_waiting, timeout, reset_input_buffer, open, close)
+    NOTE: a thread sends one line every 1/rate seconds (rate=None: no wait), or with the timing
+          of a replayed run; with limit_baud the bytes sent per second do not exceed
+          baudrate/10, as on the real port. Commands: '$', '#', '@' select the data; 'm' opens the menu (data
+          stop), 't' then a number sets the threshold, 'e' exits the menu; F, S, H, I give
+          the info read by aq.Query_Info. nLines/nBytes count what was sent; noise is the
+          fraction of lines with a non-ASCII byte (line noise)
+    INPUT: source (see Synthetic_Source, Replay_Source; default synthetic), line rate,
+           mode, threshold, baud limit, baudrate, port name, noise
+    '''
+    def __init__(self, source=None, rate=1., mode='@', threshold=200, limit_baud=True, baudrate=115200,
+                 port='virtual://', noise=0.):
+        self.source = source or Synthetic_Source()
+        self.noise = noise
+        self.rng = np.random.default_rng()
+        self.rate = rate
+        self.mode = mode
+        self.threshold = threshold
+        self.limit_baud = limit_baud
+        self.baudrate = baudrate
+        self.port = port
+        self.timeout = None
+        self.menu = False
+        self.pending = None
+        self.output = bytearray()
+        self.ready = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.nLines = 0
+        self.nBytes = 0
+        self.finished = False
+
+    ## serial.Serial interface
+    @property
+    def is_open(self):
+        return(self.thread is not None)
+
+    def open(self):
+        if self.thread: return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._Run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if not self.thread: return
+        self.stopped.set()
+        with self.ready: self.ready.notify_all()
+        self.thread.join()
+        self.thread = None
+
+    @property
+    def in_waiting(self):
+        return(len(self.output))
+
+    def read(self, size=1):
+        with self.ready:
+            if not self.output and self.timeout != 0:
+                self.ready.wait_for(lambda: self.output or self.stopped.is_set(), timeout=self.timeout)
+            data = bytes(self.output[:size])
+            del self.output[:size]
+        return(data)
+
+    def readline(self):
+        with self.ready:
+            self.ready.wait_for(lambda: b'\n' in self.output or self.stopped.is_set(), timeout=self.timeout)
+            end = self.output.find(b'\n') + 1 or len(self.output)
+            data = bytes(self.output[:end])
+            del self.output[:end]
+        return(data)
+
+    def write(self, data):
+        command = bytes(data).decode('ascii', errors='replace')
+        if self.menu and self.pending == 't' and command.strip().isdigit():
+            self.threshold = int(command.strip())
+            self.pending = None
+            self._Send(f'threshold set to {self.threshold}\r\n')
+            return(len(data))
+        for c in command.strip():
+            if self.menu:
+                if c == 'e': self.menu = False
+                elif c == 't':
+                    self.pending = 't'
+                    self._Send('threshold (0-255)?\r\n')
+                else: self._Send(f'{c} ok\r\n')
+            elif c in '$#@': self.mode = c
+            elif c == 'm':
+                self.menu = True
+                self._Send(MENU_PAGE)
+            elif c in INFO: self._Send(INFO[c] + '\r\n')
+        return(len(data))
+
+    def reset_input_buffer(self):
+        with self.ready: self.output.clear()
+
+    def flush(self):
+        pass
+
+    ## device side
+    def _Send(self, text):
+        data = text if isinstance(text, bytes) else text.encode('ascii')
+        with self.ready:
+            self.output += data
+            self.ready.notify_all()
+        self.nBytes += len(data)
+
+    def _Run(self):
+        start = time.monotonic()
+        due = start
+        while not self.stopped.is_set():
+            if self.menu:
+                self.stopped.wait(0.01)
+                due = time.monotonic()
+                continue
+            when, line = self.source(self)
+            if line is None:
+                self.finished = True
+                break
+            if when is not None: due = max(due, start + when)
+            wait = due - time.monotonic()
+            if wait > 0 and self.stopped.wait(wait): break
+            line = (Apply_Mode(line, self.mode) + '\r\n').encode('ascii')
+            if self.noise and self.rng.random() < self.noise:
+                at = self.rng.integers(1, len(line) - 2)
+                line = line[:at] + b'\xff' + line[at:]
+            self._Send(line)
+            self.nLines += 1
+            ## lines with their own time (replay) are only held back by the baud limit
+            step = 1./self.rate if self.rate and when is None else 0.
+            if self.limit_baud: step = max(step, len(line)*10./self.baudrate)
+            due += step
+
+def Open_Virtual(url='virtual://', **options):
+    '''
+    SCOPE: open a virtual device from a port name (see aq.Open_Port)
+    NOTE: virtual://?rate=10&cps=50&mode=@&seed=1&max_hits=20&threshold_scale=100&limit_baud=0&noise=0.01
+          replay://<datafile>?speed=10&loop=1&limit_baud=0  (speed=0: at rate= lines/s,
+          or as fast as the baud limit allows)
+    INPUT: the port name, options of ArduSiPM_Virtual (override the ones of the name)
+    OUTPUT: an open ArduSiPM_Virtual
+    '''
+    scheme, _, rest = url.partition('://')
+    path, _, query = rest.partition('?')
+    params = dict(parse_qsl(query))
+    number = lambda key, default, kind=float: kind(params[key]) if key in params else default
+    device = {'rate': number('rate', None if scheme == 'replay' else 1.), 'mode': params.get('mode', '@'), 'threshold': number('threshold', 200, int),
+              'limit_baud': bool(number('limit_baud', 1, int)), 'noise': number('noise', 0.), 'port': url}
+    if scheme == 'replay':
+        speed = number('speed', 1.)
+        source = Replay_Source(path, speed=speed or None, loop=bool(number('loop', 0, int)))
+    elif scheme == 'virtual':
+        source = Synthetic_Source(cps=number('cps', 10.), max_hits=number('max_hits', None, int),
+                                  threshold_scale=number('threshold_scale', None), seed=number('seed', None, int))
+    else: raise ValueError(f'unknown virtual port {url}')
+    device.update(options)
+    virtual = ArduSiPM_Virtual(source=source, **device)
+    virtual.open()
+    return(virtual)
+
+def Serve_Pty(device):
+    '''
+    SCOPE: expose a virtual device on a pseudo terminal (POSIX only), for programs that open
+           a serial port by name (e.g. the scripts in Valerio/)
+    INPUT: an ArduSiPM_Virtual
+    OUTPUT: the name of the port to open (e.g. /dev/pts/3)
+    '''
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    device.timeout = 0.05
+    device.open()
+    def Pump():
+        import select
+        while not device.stopped.is_set():
+            readable, _, _ = select.select([master], [], [], 0.01)
+            if readable:
+                try: device.write(os.read(master, 1024))
+                except OSError: break
+            data = device.read(device.in_waiting or 1)
+            if data:
+                try: os.write(master, data)
+                except OSError: break
+    threading.Thread(target=Pump, daemon=True).start()
+    return(os.ttyname(slave))
@@ -14,26 +14,31 @@
 |                    load of data-file from F.Curti DAQ              |
 | 200211 - F.Messi - Load data functions moved to a-load.py          |
 |                    Data analysis functions moved to a-analysis.py  |
+| 261018 - lazy imports, the interactive shell starts from main()    |
+|          command line with the reduce batch pipeline and benchmarks|
+|          serial port or virtual ArduSiPM (port=, aaa.py virtual)   |
  --------------------------------------------------------------------
 '''
 
 import sys
 import os
 import time
+import importlib
 from datetime import datetime, timedelta
 import csv
-import serial
-import serial.tools.list_ports
-import numpy as np
-import pandas as pd
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
 
 ## import aaa_scripts
-import Utility as ut
-import a_load as lf
-import a_analysis as an
+import a_acquire as aq
+## heavy modules (plotting stack, pandas, serial) are imported on first use:
+## aaa.lf, aaa.an, ... are loaded when accessed, main() loads them all for the shell
+LAZY_MODULES = {'np': 'numpy', 'pd': 'pandas', 'plt': 'matplotlib.pyplot', 'ut': 'Utility',
+                'lf': 'a_load', 'an': 'a_analysis', 'am': 'a_multi'}
+
+def __getattr__(name):
+    if name not in LAZY_MODULES: raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(LAZY_MODULES[name])
+    globals()[name] = module
+    return(module)
 
 def menu_long():
     print("\n ========================= ")
@@ -67,12 +72,14 @@ def menu():
     print(" available functions are:  ")
     print("   - Info_ASPM()")
     print("   - lf.Load_csv(filename=, debug=)")
-    print("   - lf.LoadMerge_cvs(directory=, InName=, OutName=, debug=)")
+    print("   - lf.Load_csv_chunks(filename=, chunksize=)")
+    print("   - lf.LoadMerge_cvs(directory=, InName=, OutName=, debug=, workers=)")
     print("   - ")
     print("   - Plot_ADC(dati, binsize=16, hRange=[0,4000])")
     print("   - ")
-    print("   - RunIt(duration_acq=0, file_par=)               ")
-    print("   - RunLoop(duration_acq, nLoops, file_par)")
+    print("   - RunIt(duration_acq=0, file_par=, lossless=, stream=, max_bytes=, max_seconds=)")
+    print("   - RunLoop(duration_acq, nLoops, file_par, lossless=, stream=)")
+    print("   - am.Run_Multi(duration_acq, ports=, labels=, file_par=)")
     print("   - ")
     print("   - menu_Long()")
     print(" ========================= \n")
@@ -95,12 +102,21 @@ def interactive():
 =================='''
 def Info_ASPM():
     '''
-    SCOPE: call to the original info script from V.Bocci
+    SCOPE: retrive basic information from ArduSiPM
+    NOTE: same queries of the original info script from V.Bocci, see aq.Query_Info
     INPUT: none
-    OUTPUT: print info on screen
+    OUTPUT: print info on screen, dict with the info
     '''
-    sys.path.append('Valerio/')
-    import ArduSiPM_info.py
+    ser = Apri_Seriale()
+    if not ser: return(0)
+    info = aq.Query_Info(ser)
+    ser.close()
+    print(f"ArduSiPM Firmware Version: {info.get('FW')}")
+    print(f"Serial Number: {info.get('SN')}")
+    print(f"HVCODE: {info.get('HV')}")
+    print(f"ID: {info.get('ID')}")
+    if 'SN' in info and 'HV' in info: print(f"Programming string: ^{info['SN']}%{info['HV']}")
+    return(info)
 
 def Search_ASPM(baudrate=115200, timeout=None, debug=False):
     '''
@@ -110,6 +126,7 @@ def Search_ASPM(baudrate=115200, timeout=None, debug=False):
     OUTPUT: string with serial name
     '''
     #Scan Serial ports and found ArduSiPM
+    import serial.tools.list_ports
     if(debug): print('Serial ports available:')
     ports = list(serial.tools.list_ports.comports())
     for i in range (0,len(ports)):
@@ -122,42 +139,33 @@ def Search_ASPM(baudrate=115200, timeout=None, debug=False):
         else :
             print ("no ArduSiPM, looking more...")
 
-def Apri_Seriale():
-	ser = serial.Serial()
-	ser.baudrate = 115200
-	ser.timeout=None
-	ser_num = Search_ASPM()
-	if (ser_num):
-	        ser.port = ser_num
-	        ser.open()
-	        time.sleep(1)
-	else:
+def Apri_Seriale(port=None):
+	'''
+	SCOPE: open the ArduSiPM port (or a virtual device, see aq.Open_Port)
+	'''
+	ser = aq.Open_Port(port or Search_ASPM(), baudrate=115200, timeout=None)
+	if not ser:
 	        print('ArduSiPM not found please connect')
 	        return(0)
 	return(ser)
 
 def Scrivi_Seriale(comando, ser):
+    '''
+    SCOPE: send a menu command (m, <comando>, e) waiting the answer of ArduSiPM to each step
+    '''
     if(ser):
-        ser.write(str('m').encode('utf-8'))
-        time.sleep(2)
-        ser.write(str(comando).encode('utf-8'))
-        time.sleep(2)
-        ser.write(str('e').encode('utf-8'))
+        aq.Menu_Command(ser, comando)
         print(f'wrote on serial {comando}')
-        time.sleep(0.5)
 
 def SetThreshold(threshold, ser):
+    '''
+    SCOPE: set the threshold (m, t, <threshold>, e) waiting the answer of ArduSiPM to each step
+    '''
     if(ser):
-        ser.write(str('m').encode('utf-8'))
-        time.sleep(2)
-        ser.write(str('t').encode('utf-8'))
-        time.sleep(2)
         #ser.write(threshold.to_bytes(4, 'little'))
         #ser.write(b'10')
-        ser.write(str(threshold).encode('utf-8'))
-        time.sleep(4)
-        ser.write(str('e').encode('utf-8'))
-        time.sleep(2)
+        if not aq.Set_Threshold(ser, threshold):
+            print(f'    threshold {threshold} not acknowledged by ArduSiPM')
 
 
 '''==================
@@ -165,7 +173,9 @@ def SetThreshold(threshold, ser):
 =================='''
 def Save_Data(data, file_name='my_data.csv'):
     '''
-    SCOPE:
+    SCOPE: save the recorded data on file, one record per line
+    NOTE: files written with the old format (all the records on a single line,
+          separated by ',') are still read by the lf.Load_* functions
     INPUT: file name and data in binary format
     OUTPUT:
     '''
@@ -173,48 +183,39 @@ def Save_Data(data, file_name='my_data.csv'):
         #writer = csv.writer(file, delimiter=',')
         for line in data:
             file.write(line)#.decode('ascii'))
-            file.write(',')
+            file.write('\n')
 
-def Acquire_ASPM(duration_acq, ser, debug=False):
+def Acquire_ASPM(duration_acq, ser, debug=False, lossless=False):
     '''
     SCOPE:
+    NOTE: by default one line is sampled every 0.2 sec, discarding what ArduSiPM sent
+          in between; with lossless=True all the lines are recorded (see aq.Acquire_Lossless)
     INPUT: duration in seconds
     OUTPUT: a DataFraMe with the data
     '''
-    lista = []
-    start_acq_time = datetime.now()
-    stop_acq_time = start_acq_time + timedelta(seconds=duration_acq-1)
-    acq_time = datetime.now()
-    while(acq_time < stop_acq_time):
-        acq_time = datetime.now()
-        #print(acq_time.strftime('%H:%M:%S'))
-        ser.reset_input_buffer() # Flush all the previous data in Serial port
-        data = ser.readline().rstrip()
-        tdata = f"u{acq_time.strftime('%y%m%d%H%M%S.%f')}{data.decode('ascii')}"
-        if(debug): print(tdata)
-        lista.append(tdata)
-        time.sleep(0.2)
-    return(lista)
+    if lossless:
+        lista, reader = aq.Acquire_Lossless(duration_acq, ser, debug=debug)
+        return(lista)
+    return(aq.Acquire_Sampled(duration_acq, ser, debug=debug))
 
-def RunIt(duration_acq=0, file_par='RawData', threshold=200, debug=False):
+def RunIt(duration_acq=0, file_par='RawData', threshold=200, debug=False, lossless=False,
+          stream=False, max_bytes=None, max_seconds=None, monitor=False, port=None):
     '''
     SCOPE:
     NOTE: copied and adapted from the original script from V.Bocci
+          with stream=True the data are written on disk while acquiring (see aq.Acquire_Stream),
+          files are rotated every max_bytes / max_seconds, and the list of files is returned;
+          monitor=True (implies stream) shows a live plot of CPS, ADC and TDC (see a_monitor);
+          port selects the device, also a virtual one: 'virtual://?rate=100&cps=50' or
+          'replay://<datafile>?speed=10' (see aq.Open_Port)
     INPUT:
     OUTPUT:
     '''
     start_time = datetime.now()
     stopat = start_time+timedelta(seconds=duration_acq)
     ## serial connection
-    ser = serial.Serial()
-    ser.baudrate = 115200
-    ser.timeout=None #try to solve delay
-    ser_num = Search_ASPM()
-    if (ser_num):
-        ser.port = ser_num
-        ser.open()
-        time.sleep(1)
-    else:
+    ser = aq.Open_Port(port or Search_ASPM(), baudrate=115200, timeout=None) #try to solve delay
+    if not ser:
         print('ArduSiPM not found please connect')
         return(0)
     ## acquisition
@@ -226,37 +227,66 @@ def RunIt(duration_acq=0, file_par='RawData', threshold=200, debug=False):
     #time.sleep(0.5)
     #ser.write(b'@')
     #time.sleep(0.5)
-    ser.write(b'#')
-    time.sleep(0.5)
+    aq.Set_Mode(ser, '#')
     SetThreshold(threshold, ser)
-    ser.write(b'$')
-    time.sleep(4)
-    #ser.write(b'#') ## ADC+CPS
-    ser.write(b'@') ## TDC+ADC+CPS
-    time.sleep(0.5)
+    aq.Set_Mode(ser, '$')
+    #aq.Set_Mode(ser, '#') ## ADC+CPS
+    aq.Set_Mode(ser, '@') ## TDC+ADC+CPS
     print(f'Acquiring now... this run will stop at {stopat}')
-    data = Acquire_ASPM(duration_acq, ser, debug=debug)
+    if stream or monitor:
+        if monitor:
+            import a_monitor as mon
+            monitor = mon.ArduSiPM_Monitor(title=file_par)
+        else: monitor = None
+        files = aq.Acquire_Stream(duration_acq, ser, file_par=file_par, debug=debug,
+                                  max_bytes=max_bytes, max_seconds=max_seconds, monitor=monitor)
+        ser.close()
+        return files
+    data = Acquire_ASPM(duration_acq, ser, debug=debug, lossless=lossless)
     print('SAVING DATA...')
     Save_Data(data, f"{start_time.strftime('%y%m%d%H%M%S')}_{file_par}.csv")
     ser.close()
     return data
 
-def RunLoop(duration_acq, nLoops, file_par, threshold=200):
+def RunLoop(duration_acq, nLoops, file_par, threshold=200, lossless=False, stream=False):
+    '''
+    SCOPE: nLoops runs of duration_acq seconds each
+    NOTE: the connection stays open across the runs (see aq.ArduSiPM_Session)
+    '''
     print(f'Start running {nLoops} loops of {duration_acq} sec each')
     print()
-    i = 1
-    while i <= nLoops:
-        print(f'Run now loop n. {i} of {nLoops}')
-        RunIt(duration_acq=duration_acq, file_par=file_par, threshold=threshold)
-        i=i+1
+    ser_num = Search_ASPM()
+    if not ser_num:
+        print('ArduSiPM not found please connect')
+        return(0)
+    session = aq.ArduSiPM_Session(port=ser_num)
+    try:
+        i = 1
+        while i <= nLoops:
+            print(f'Run now loop n. {i} of {nLoops}')
+            session.Run(duration_acq, file_par=file_par, threshold=threshold, lossless=lossless, stream=stream)
+            i=i+1
+    finally:
+        session.Close()
 
-def ScanThreshold(duration_acq=3600, debug=False, prefix=None):
+def ScanThreshold(duration_acq=3600, debug=False, prefix=None, lossless=False):
+    '''
+    SCOPE: one run for each threshold from 10 to 255
+    NOTE: the connection stays open across the runs (see aq.ArduSiPM_Session)
+    '''
     step = 20
-    for t in range(10, 255, step):
-        print(f'I will now run threshold {t} (range 10-255, steps {step})')
-        time.sleep(10)
-        nomeFile = prefix + f'CTA-ThresholdScan_{t}'
-        RunIt(duration_acq=duration_acq, file_par=nomeFile, threshold=t, debug=debug)
+    ser_num = Search_ASPM()
+    if not ser_num:
+        print('ArduSiPM not found please connect')
+        return(0)
+    session = aq.ArduSiPM_Session(port=ser_num, debug=debug)
+    try:
+        for t in range(10, 255, step):
+            print(f'I will now run threshold {t} (range 10-255, steps {step})')
+            nomeFile = (prefix or '') + f'CTA-ThresholdScan_{t}'
+            session.Run(duration_acq, file_par=nomeFile, threshold=t, lossless=lossless)
+    finally:
+        session.Close()
 
 
 
@@ -264,5 +294,96 @@ def ScanThreshold(duration_acq=3600, debug=False, prefix=None):
 '''==================
      Interactive menu
 =================='''
-menu()
-interactive()
+def Shell(backend='TkAgg'):
+    '''
+    SCOPE: interactive shell with all the aaa modules and the plotting stack loaded
+    NOTE: importing aaa does not start the shell (batch jobs, machines without display)
+    INPUT: matplotlib backend for the shell
+    '''
+    import matplotlib
+    matplotlib.use(backend)
+    for name in LAZY_MODULES: __getattr__(name)
+    menu()
+    interactive()
+
+def main(argv=None):
+    '''
+    SCOPE: command line of aaa
+    NOTE: python aaa.py                  -> interactive shell (as before)
+          python aaa.py reduce <dir> ... -> batch reduction (see a_reduce.Reduce), the json
+                                            summary is printed on stdout (or saved with --summary)
+          python aaa.py bench ...        -> benchmarks on synthetic data (see a_bench.Run_Bench),
+                                            --acquisition: rates of the acquisition path
+                                            with a virtual ArduSiPM (see a_bench.Run_Acquisition_Bench)
+                                            --replay: replay speed of the virtual ArduSiPM (see a_bench.Run_Replay_Check)
+          python aaa.py virtual [port]   -> virtual ArduSiPM on a pseudo terminal (see a_virtual)
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(prog='aaa', description='ArduSiPM Acquisition & Analysis')
+    commands = parser.add_subparsers(dest='command')
+    shell = commands.add_parser('shell', help='interactive IPython shell (default)')
+    shell.add_argument('--backend', default='TkAgg', help='matplotlib backend')
+    reduce = commands.add_parser('reduce', help='load, quality flag, histogram and export the files of a folder')
+    reduce.add_argument('directory', help='folder with the csv data files')
+    reduce.add_argument('--label', dest='InName', help='only files whose name contains LABEL')
+    reduce.add_argument('--exclude', dest='OutName', help='skip files whose name contains EXCLUDE')
+    reduce.add_argument('--out', help='spectra table (.parquet, .csv or .pkl)')
+    reduce.add_argument('--summary', help='json summary file (default: stdout)')
+    reduce.add_argument('--workers', type=int, default=None, help='worker processes (default: number of CPU)')
+    reduce.add_argument('--no-cache', dest='cache', action='store_false', help='do not use/write the parsed-data cache')
+    reduce.add_argument('--cache-dir', default=None, help='cache folder (default: <directory>/.aaa_cache)')
+    bench = commands.add_parser('bench', help='benchmark of loaders and analysis on synthetic data')
+    bench.add_argument('-n', type=int, default=100000, help='records per file')
+    bench.add_argument('--files', type=int, default=4, help='number of files')
+    bench.add_argument('--cps', type=float, default=10., help='mean CPS')
+    bench.add_argument('--corrupt', type=float, default=0.001, help='fraction of corrupted records')
+    bench.add_argument('--workers', type=int, default=None, help='worker processes of Load_Merge_csv')
+    bench.add_argument('--no-memory', dest='memory', action='store_false', help='do not measure peak memory')
+    bench.add_argument('--out', help='save the results (.csv)')
+    bench.add_argument('--acquisition', action='store_true', help='acquisition throughput with a virtual ArduSiPM')
+    bench.add_argument('--rates', type=int, nargs='+', default=[100, 1000, 3000], help='line rates of --acquisition')
+    bench.add_argument('--duration', type=float, default=5., help='seconds per rate of --acquisition')
+    bench.add_argument('--replay', action='store_true', help='check the replay speed of the virtual ArduSiPM')
+    virtual = commands.add_parser('virtual', help='serve a virtual ArduSiPM on a pseudo terminal')
+    virtual.add_argument('port', nargs='?', default='virtual://?rate=1&cps=10',
+                         help='virtual://?rate=&cps=... or replay://<datafile>?speed=... (see a_virtual.Open_Virtual)')
+    args = parser.parse_args(argv)
+    if args.command == 'reduce':
+        import json
+        import a_reduce as rd
+        result, histos = rd.Reduce(args.directory, InName=args.InName, OutName=args.OutName, out=args.out,
+                                   summary=args.summary, workers=args.workers, cache=args.cache,
+                                   cache_dir=args.cache_dir, stderr=not args.summary)
+        if not args.summary: print(json.dumps(result, indent=1))
+        return(0 if result['files'] else 1)
+    if args.command == 'bench':
+        import matplotlib
+        matplotlib.use('Agg')
+        import a_bench as bm
+        if args.replay:
+            table = bm.Run_Replay_Check()
+            if args.out: table.to_csv(args.out)
+            return(0 if table.ok.all() else 1)
+        if args.acquisition:
+            table = bm.Run_Acquisition_Bench(rates=args.rates, duration=args.duration, cps=args.cps)
+            if args.out: table.to_csv(args.out)
+            return(0)
+        table = bm.Run_Bench(n=args.n, nFiles=args.files, cps=args.cps, corrupt=args.corrupt,
+                             workers=args.workers, memory=args.memory)
+        if args.out: table.to_csv(args.out)
+        return(0)
+    if args.command == 'virtual':
+        import a_virtual as av
+        device = av.Open_Virtual(args.port)
+        print(f'virtual ArduSiPM on {av.Serve_Pty(device)} (Ctrl-C to stop)')
+        try:
+            while not device.finished: time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        device.close()
+        return(0)
+    Shell(backend=getattr(args, 'backend', 'TkAgg'))
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main())